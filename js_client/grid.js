@@ -130,6 +130,48 @@ export class CrosswordGrid extends LitElement {
 
     }
 
+    createGridByCompact(compact) {
+        // expands the compact wire format (one string per row, '#' for hint and ' ' for
+        // empty cells, flat hint and solution lists) into the json format
+        const grid = [];
+        var hint_index = 0;
+        var y;
+        for (y = 0; y < compact.h; y++) {
+            const row = [];
+            for (const c of Array.from(compact.rows[y])) {
+                if (c === ' ') {
+                    row.push({ 'cell_type': 'empty' });
+                }
+                else if (c === '#') {
+                    row.push({
+                        'cell_type': 'hint',
+                        'horizontal_hint': compact.hints[2 * hint_index],
+                        'vertical_hint': compact.hints[2 * hint_index + 1]
+                    });
+                    hint_index += 1;
+                }
+                else {
+                    row.push({ 'cell_type': 'letter', 'letter': c });
+                }
+            }
+            grid.push(row);
+        }
+
+        const solution = [];
+        var i;
+        for (i = 0; i < compact.solution.length; i += 2) {
+            solution.push([compact.solution[i], compact.solution[i + 1]]);
+        }
+
+        this.createGridByJson({
+            'w': compact.w,
+            'h': compact.h,
+            'grid': grid,
+            'solution': solution,
+            'density': compact.density
+        });
+    }
+
     focusNextCellHorizontal(x, y, skip_revealed = false) {
         if (x + 1 < this.width && this.grid[y][x + 1].getGridType() === gridType.LETTER) {
             if (this.grid[y][x].getGridType() === gridType.LETTER) {
@@ -352,6 +394,53 @@ export class CrosswordGrid extends LitElement {
         this.serverConnection.sendMessage(msg)
     }
 
+    enterWord(x, y, word) {
+        // writes the letters of word into the letter cells from x, y on in the current
+        // direction, skipping revealed cells, and sends them as one batch update
+        const dx = this.lastMoveVertical ? 0 : 1;
+        const dy = this.lastMoveVertical ? 1 : 0;
+        const updates = [];
+        var cx = x;
+        var cy = y;
+        var lastX = -1;
+        var lastY = -1;
+
+        for (const letter of Array.from(word.replace(/\s/g, ''))) {
+            while (cx < this.width && cy < this.height && this.grid[cy][cx].getGridType() === gridType.LETTER
+                && this.grid[cy][cx].getGridLetter().revealed) {
+                cx += dx;
+                cy += dy;
+            }
+            if (cx >= this.width || cy >= this.height || this.grid[cy][cx].getGridType() !== gridType.LETTER) {
+                break;
+            }
+
+            const gridLetter = this.grid[cy][cx].getGridLetter();
+            gridLetter.value = letter;
+            if (gridLetter.solutionIndex >= 0) {
+                this.setSolutionLetter(gridLetter.solutionIndex, letter);
+            }
+            updates.push({
+                'x': cx,
+                'y': cy,
+                'letter': letter
+            });
+
+            lastX = cx;
+            lastY = cy;
+            cx += dx;
+            cy += dy;
+        }
+
+        if (updates.length > 0) {
+            this.sendMessage({
+                'type': 'batch_update',
+                'updates': updates
+            });
+            this.focusNextCell(lastX, lastY);
+        }
+    }
+
     setSolutionLetter(solutionNumber, letter, revealed = false) {
         this.solutionBox.setLetter(solutionNumber, letter, revealed);
         const x = this.solution_locations[solutionNumber][1];
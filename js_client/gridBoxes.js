@@ -243,6 +243,16 @@ export class GridLetter extends GridBox {
             return
         }
 
+        if (this.value.length > 1 && e.inputType === "insertFromPaste") {
+            // a pasted word goes into this and the following cells
+            const word = this.value;
+            this.value = oldVal;
+            this.crosswordGrid.enterWord(this.x, this.y, word);
+            e.target.value = this.value;
+            e.handled = true;
+            return;
+        }
+
         if (this.value.length > 1) {
             this.value = this.value[0];
             e.target.value = this.value
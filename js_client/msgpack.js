@@ -0,0 +1,125 @@
+// minimal MessagePack decoder for the messages of the server's msgpack codec
+// (nil, booleans, integers, floats, strings, binary, arrays and maps)
+
+const textDecoder = new TextDecoder();
+
+class Reader {
+    constructor(buffer) {
+        this.bytes = new Uint8Array(buffer);
+        this.view = new DataView(this.bytes.buffer, this.bytes.byteOffset, this.bytes.byteLength);
+        this.offset = 0;
+    }
+
+    uint(size) {
+        var value;
+        switch (size) {
+            case 1: value = this.view.getUint8(this.offset); break;
+            case 2: value = this.view.getUint16(this.offset); break;
+            case 4: value = this.view.getUint32(this.offset); break;
+            case 8: value = Number(this.view.getBigUint64(this.offset)); break;
+        }
+        this.offset += size;
+        return value;
+    }
+
+    int(size) {
+        var value;
+        switch (size) {
+            case 1: value = this.view.getInt8(this.offset); break;
+            case 2: value = this.view.getInt16(this.offset); break;
+            case 4: value = this.view.getInt32(this.offset); break;
+            case 8: value = Number(this.view.getBigInt64(this.offset)); break;
+        }
+        this.offset += size;
+        return value;
+    }
+
+    float(size) {
+        const value = size === 4 ? this.view.getFloat32(this.offset) : this.view.getFloat64(this.offset);
+        this.offset += size;
+        return value;
+    }
+
+    str(length) {
+        const value = textDecoder.decode(this.bytes.subarray(this.offset, this.offset + length));
+        this.offset += length;
+        return value;
+    }
+
+    bin(length) {
+        const value = this.bytes.slice(this.offset, this.offset + length);
+        this.offset += length;
+        return value;
+    }
+
+    array(length) {
+        const value = new Array(length);
+        var i;
+        for (i = 0; i < length; i++) {
+            value[i] = this.read();
+        }
+        return value;
+    }
+
+    map(length) {
+        const value = {};
+        var i;
+        for (i = 0; i < length; i++) {
+            const key = this.read();
+            value[key] = this.read();
+        }
+        return value;
+    }
+
+    read() {
+        const type = this.uint(1);
+
+        if (type <= 0x7f) {
+            return type;
+        }
+        if (type >= 0xe0) {
+            return type - 0x100;
+        }
+        if ((type & 0xf0) === 0x80) {
+            return this.map(type & 0x0f);
+        }
+        if ((type & 0xf0) === 0x90) {
+            return this.array(type & 0x0f);
+        }
+        if ((type & 0xe0) === 0xa0) {
+            return this.str(type & 0x1f);
+        }
+
+        switch (type) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: return this.bin(this.uint(1));
+            case 0xc5: return this.bin(this.uint(2));
+            case 0xc6: return this.bin(this.uint(4));
+            case 0xca: return this.float(4);
+            case 0xcb: return this.float(8);
+            case 0xcc: return this.uint(1);
+            case 0xcd: return this.uint(2);
+            case 0xce: return this.uint(4);
+            case 0xcf: return this.uint(8);
+            case 0xd0: return this.int(1);
+            case 0xd1: return this.int(2);
+            case 0xd2: return this.int(4);
+            case 0xd3: return this.int(8);
+            case 0xd9: return this.str(this.uint(1));
+            case 0xda: return this.str(this.uint(2));
+            case 0xdb: return this.str(this.uint(4));
+            case 0xdc: return this.array(this.uint(2));
+            case 0xdd: return this.array(this.uint(4));
+            case 0xde: return this.map(this.uint(2));
+            case 0xdf: return this.map(this.uint(4));
+        }
+
+        throw `unsupported msgpack type ${type}`;
+    }
+}
+
+export function decodeMsgpack(buffer) {
+    return new Reader(buffer).read();
+}
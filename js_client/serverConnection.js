@@ -1,6 +1,7 @@
 import { html, css, LitElement } from 'https://unpkg.com/lit-element/lit-element.js?module';
 import { WebsocketConnection } from './websocket.js';
 import { getCookie, setCookie } from './cookie.js';
+import { decodeMsgpack } from './msgpack.js';
 
 export class ServerConnection extends WebsocketConnection {
     static get styles() {
@@ -21,6 +22,10 @@ export class ServerConnection extends WebsocketConnection {
         this.isRegistered = false;
         this.crossword_grid = null;
         this.difficulty = 0;
+        // last seen session version and the session it belongs to, sent on reconnect
+        // so the server only sends the updates missed in between
+        this.version = null;
+        this.versionSessionId = null;
 
     }
 
@@ -55,12 +60,17 @@ export class ServerConnection extends WebsocketConnection {
     register() {
         this.updateLocalSessionId();
         console.log("register", this.sessionId);
-        this.sendMessage({
+        const msg = {
             'type': 'register',
             'sessionId': this.sessionId,
             'difficulty': this.difficulty,
-            'lang': this.lang
-        });
+            'lang': this.lang,
+            'format': 'compact'
+        };
+        if (this.version !== null && this.sessionId === this.versionSessionId) {
+            msg['version'] = this.version;
+        }
+        this.sendMessage(msg);
     }
 
     onopen(event) {
@@ -88,10 +98,30 @@ export class ServerConnection extends WebsocketConnection {
     }
 
     handleCrossword(crossword) {
-        this.crossword_grid.createGridByJson(crossword);
+        if (crossword.hasOwnProperty("rows")) {
+            this.crossword_grid.createGridByCompact(crossword);
+        }
+        else {
+            this.crossword_grid.createGridByJson(crossword);
+        }
+        this.version = null;
+        this.versionSessionId = this.sessionId;
+    }
+
+    handleCompactUpdate(updates) {
+        // flat list of x, y, letter, revealed per update
+        var i = 0;
+        for (i = 0; i + 3 < updates.length; i += 4) {
+            this.crossword_grid.updateLetter(updates[i], updates[i + 1], updates[i + 2], updates[i + 3] === 1);
+        }
     }
 
     handleUpdate(updates) {
+        if (updates.length > 0 && typeof updates[0] === "number") {
+            this.handleCompactUpdate(updates);
+            return;
+        }
+
         var i = 0;
         for (i = 0; i < updates.length; i++) {
             const item = updates[i];
@@ -115,7 +145,8 @@ export class ServerConnection extends WebsocketConnection {
     onmessage(event) {
         super.onmessage(event)
         try {
-            const msg = JSON.parse(event.data);
+            // text frames are json, binary ones msgpack
+            const msg = (typeof event.data === "string") ? JSON.parse(event.data) : decodeMsgpack(event.data);
             if (!msg.type) {
                 throw "missing type"
             }
@@ -130,6 +161,9 @@ export class ServerConnection extends WebsocketConnection {
                 }
                 case 'update': {
                     this.handleUpdate(msg.updates);
+                    if (msg.hasOwnProperty("version")) {
+                        this.version = msg.version;
+                    }
                     break
                 }
 
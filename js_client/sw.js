@@ -1,4 +1,4 @@
-const cacheName = 'pwa-conf-v4';
+const cacheName = 'pwa-conf-v5';
 const staticAssets = [
     './app.js ',
     './big_icon.png',
@@ -13,6 +13,7 @@ const staticAssets = [
     './gridBoxes.js',
     './index.html',
     './main.js',
+    './msgpack.js',
     './solutionBox.js',
     './websocket.js'
 ];
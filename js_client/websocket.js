@@ -64,7 +64,9 @@ export class WebsocketConnection extends LitElement {
 
     connect() {
         console.log(`connect to ${this.url}...`);
-        this.socket = new WebSocket(this.url);
+        // message codecs in order of preference, see the server's json_websockets
+        this.socket = new WebSocket(this.url, ['crossword.msgpack', 'crossword.json']);
+        this.socket.binaryType = 'arraybuffer';
         this.socket.onopen = (event) => this.onopen(event);
         this.socket.onclose = (event) => this.onclose(event);
         this.socket.onerror = (event) => this.onerror(event);
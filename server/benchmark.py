@@ -0,0 +1,156 @@
+import argparse
+import itertools
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+
+from . import crossword_generator
+from . import crossword_filler
+
+# generator benchmark. Runs the generator over a matrix of sizes, densities, languages
+# and difficulties with fixed seeds, so two runs only differ by the code under test.
+#
+# usage:
+#   python -m server.benchmark --output baseline.json
+#   python -m server.benchmark --compare baseline.json
+
+DEFAULT_SIZES = ("10x10", "20x20", "30x30")
+DEFAULT_DENSITIES = (0.5, 0.55)
+DEFAULT_LANGS = ("en", "de")
+DEFAULT_DIFFICULTIES = (0, 1, 2)
+
+
+def generate(backend: str, w: int, h: int, lang: str, density: float, difficulty: int, seed: int, stats: dict,
+             time_budget: float = None):
+    deadline = None if time_budget is None else time.time() + time_budget
+
+    if backend == "backtracking":
+        return crossword_filler.fill_word_grid(w, h, lang, density, difficulty,
+                                               seed=seed, stats=stats, deadline=deadline)
+
+    return crossword_generator.create_word_grid(w, h, lang, density, difficulty,
+                                                mode=backend, seed=seed, stats=stats, deadline=deadline)
+
+
+def run_case(backend: str, w: int, h: int, lang: str, density: float, difficulty: int, repeat: int,
+             time_budget: float = None) -> dict:
+    times = []
+    iterations = []
+    densities = []
+    words = []
+    timings = {}
+
+    for seed in range(repeat):
+        stats = {}
+        t_start = time.perf_counter()
+        generate(backend, w, h, lang, density, difficulty, seed, stats, time_budget)
+        times.append(time.perf_counter() - t_start)
+
+        iterations.append(stats['iterations'])
+        densities.append(stats['density'])
+        words.append(stats['words'])
+        for phase, t in stats.get('timings', {}).items():
+            timings[phase] = timings.get(phase, 0.0) + t / repeat
+
+    # peak memory is measured in an extra run, tracemalloc slows down the timed ones
+    tracemalloc.start()
+    generate(backend, w, h, lang, density, difficulty, 0, {}, time_budget)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'time_mean': statistics.mean(times),
+        'time_median': statistics.median(times),
+        'time_max': max(times),
+        'iterations': statistics.mean(iterations),
+        'density': statistics.mean(densities),
+        'words': statistics.mean(words),
+        'peak_memory': peak_memory,
+        'timings': timings
+    }
+
+
+def get_case_key(backend: str, w: int, h: int, lang: str, density: float, difficulty: int) -> str:
+    return f"{backend}/{lang}/{w}x{h}/density={density}/difficulty={difficulty}"
+
+
+def run(backend: str, sizes: list, densities: list, langs: list, difficulties: list, repeat: int,
+        time_budget: float = None) -> dict:
+    results = {}
+
+    for lang in langs:
+        # load database and indices up front, so loading is not part of the first case
+        crossword_generator.get_word_index(lang).get_letter_count_index(max_length=100, min_length=8)
+        if backend != "random":
+            crossword_generator.get_pattern_index(lang)
+
+    for lang, size, density, difficulty in itertools.product(langs, sizes, densities, difficulties):
+        w, h = (int(v) for v in size.split("x"))
+        key = get_case_key(backend, w, h, lang, density, difficulty)
+        results[key] = run_case(backend, w, h, lang, density, difficulty, repeat, time_budget)
+        print_result(key, results[key])
+
+    return results
+
+
+def print_result(key: str, result: dict):
+    print(f"{key:50} time: {result['time_mean'] * 1000:8.1f}ms  "
+          f"iterations: {result['iterations']:7.1f}  "
+          f"density: {result['density']:.3f}  "
+          f"words: {result['words']:5.1f}  "
+          f"peak memory: {result['peak_memory'] / 1024:8.1f}KiB")
+    if len(result['timings']) > 0:
+        print(" " * 51 + "  ".join(f"{phase}: {t * 1000:.1f}ms" for phase, t in result['timings'].items()))
+
+
+def compare(results: dict, baseline: dict):
+    # relative change of every metric, negative values are improvements for time,
+    # iterations and memory and regressions for density and words
+    print()
+    print("compared to baseline:")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        changes = []
+        for metric in ('time_mean', 'iterations', 'density', 'words', 'peak_memory'):
+            if old[metric] == 0:
+                continue
+            changes.append(f"{metric}: {(result[metric] / old[metric] - 1) * 100:+6.1f}%")
+        print(f"{key:50} " + "  ".join(changes))
+
+    missing = [key for key in baseline if key not in results]
+    if len(missing) > 0:
+        print(f"{len(missing)} baseline cases not run")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="crossword generator benchmark")
+    parser.add_argument("--backend", default="random", choices=("random", "pattern", "backtracking"))
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="e.g. 20x20")
+    parser.add_argument("--densities", nargs="+", type=float, default=DEFAULT_DENSITIES)
+    parser.add_argument("--langs", nargs="+", default=DEFAULT_LANGS)
+    parser.add_argument("--difficulties", nargs="+", type=int, default=DEFAULT_DIFFICULTIES)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, seeded 0..repeat-1")
+    parser.add_argument("--time-budget", type=float, help="generation deadline in seconds")
+    parser.add_argument("--output", help="write the results as json baseline")
+    parser.add_argument("--compare", help="json baseline of an earlier run")
+    args = parser.parse_args()
+
+    results = run(args.backend, args.sizes, args.densities, args.langs, args.difficulties, args.repeat,
+                  args.time_budget)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import concurrent.futures
+import itertools
+import logging
+import os
+import random
+import time
+
+from . import crossword_generator
+from . import puzzle_archive
+
+# offline batch builder, appends pre-built crosswords to a puzzle archive.
+# The server loads them via CROSSWORD_PUZZLE_ARCHIVE instead of generating on demand.
+#
+# usage:
+#   python -m server.build_puzzles puzzles.cwa --count 1000 --langs en de --sizes 20x20
+
+
+def build_puzzle(width: int, height: int, lang: str, difficulty: int, density: float, seed: int) -> bytes:
+    # runs inside a worker process, returns the encoded archive payload.
+    # The generated grid leaves space for the additional hint row and column
+    stats = {}
+    raw_grid, word_infos, solution_locations = crossword_generator.create_word_grid(width - 1,
+                                                                                    height - 1,
+                                                                                    lang_code=lang,
+                                                                                    target_density=density,
+                                                                                    difficulty=difficulty,
+                                                                                    seed=seed,
+                                                                                    stats=stats)
+    if len(solution_locations) == 0:
+        return None
+
+    return puzzle_archive.encode_puzzle(raw_grid, word_infos, solution_locations, stats['density'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build crosswords into a puzzle archive")
+    parser.add_argument("archive", help="archive file, created if it does not exist")
+    parser.add_argument("--count", type=int, default=100, help="puzzles per lang, difficulty and size")
+    parser.add_argument("--langs", nargs="+", default=("en", "de"))
+    parser.add_argument("--difficulties", nargs="+", type=int, default=(0, 1, 2))
+    parser.add_argument("--sizes", nargs="+", default=("20x20",), help="crossword size, e.g. 20x20")
+    parser.add_argument("--density", type=float, default=0.55)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, help="first seed, random by default")
+    args = parser.parse_args()
+
+    archive = puzzle_archive.PuzzleArchive(args.archive, writable=True)
+
+    seed = args.seed if args.seed is not None else random.getrandbits(32)
+
+    jobs = []
+    for lang, difficulty, size in itertools.product(args.langs, args.difficulties, args.sizes):
+        width, height = (int(v) for v in size.split("x"))
+        for _ in range(args.count):
+            jobs.append((lang, difficulty, width, height, seed))
+            seed += 1
+
+    print(f"building {len(jobs)} puzzles with {args.processes} processes")
+
+    t_start = time.time()
+    n_written = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.processes) as executor:
+        futures = {executor.submit(build_puzzle, width, height, lang, difficulty, args.density, seed):
+                   (lang, difficulty, width, height) for lang, difficulty, width, height, seed in jobs}
+
+        for future in concurrent.futures.as_completed(futures):
+            lang, difficulty, width, height = futures[future]
+            try:
+                payload = future.result()
+            except Exception as e:
+                logging.error("error building puzzle: %s", str(e))
+                continue
+
+            if payload is None:
+                continue
+
+            archive.append(lang, difficulty, width, height, payload)
+            n_written += 1
+
+            if n_written % 1000 == 0:
+                print(f"{n_written} puzzles written")
+
+    archive.close()
+
+    print(f"{n_written} puzzles written in {time.time() - t_start:.1f} seconds")
+
+
+if __name__ == "__main__":
+    # the generator logs every single puzzle on info level
+    logging.basicConfig(level=logging.WARNING)
+    main()
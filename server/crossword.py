@@ -1,10 +1,14 @@
 import enum
 import json
+import array
 import logging
+import random
+import concurrent.futures
 import numpy as np
 from numpy.lib.function_base import diff
 
 from . import crossword_generator
+from . import crossword_filler
 
 from enum import Enum
 
@@ -23,274 +27,488 @@ class FieldType(Enum):
     LETTER = 2
 
 
-class Field(object):
-    def __init__(self, field_type: FieldType = FieldType.EMPTY):
-        self._field_type = field_type
+def generate_raw_grid(backend: str, w: int, h: int, lang_code: str, density: float, difficulty: int,
+                      seed: int = None, deadline: float = None, stop_event=None):
+    # returns (raw_grid, word_infos, solution_locations, stats). Top level function,
+    # so it can be submitted to a process pool
+    if backend == "backtracking":
+        generate = crossword_filler.fill_word_grid
+    else:
+        generate = crossword_generator.create_word_grid
 
-    def get_type(self) -> FieldType:
-        return self._field_type
+    stats = {}
+    raw_grid, word_infos, solution_locations = generate(w,
+                                                        h,
+                                                        lang_code=lang_code,
+                                                        target_density=density,
+                                                        difficulty=difficulty,
+                                                        seed=seed,
+                                                        stats=stats,
+                                                        deadline=deadline,
+                                                        stop_event=stop_event)
 
-    def get_content(self) -> str:
-        return None
+    return raw_grid, word_infos, solution_locations, stats
 
-    def serialize(self):
-        type_names = {
-            FieldType.EMPTY: "empty",
-            FieldType.HINT: "hint",
-            FieldType.LETTER: "letter"
-        }
-
-        return {
-            'cell_type': type_names[self._field_type]
-        }
-
-
-class HintField(Field):
-    def __init__(self, horizontal_hint: str = None, vertical_hint: str = None):
-        super().__init__(field_type=FieldType.HINT)
-
-        self._horizontal_hint = horizontal_hint
-        self._vertical_hint = vertical_hint
 
-    def get_horizontal_hint(self) -> str:
-        return self._horizontal_hint
+def pack_updates(updates: list) -> list:
+    # compact wire format of a list of updates, one flat list with
+    # x, y, letter and 1 for revealed letters or 0 for user input per update
+    packed = []
+    for update in updates:
+        if 'revealed' in update:
+            packed += (update['x'], update['y'], update['revealed'], 1)
+        else:
+            packed += (update['x'], update['y'], update['user_input'], 0)
+    return packed
 
-    def get_vertical_hint(self) -> str:
-        return self._vertical_hint
 
-    def set_horizintal_hint(self, hint: str):
-        self._horizontal_hint = hint
-
-    def set_vertical_hint(self, hint: str):
-        self._vertical_hint = hint
-
-    def serialize(self):
-        result = super().serialize()
-        result['vertical_hint'] = self._vertical_hint
-        result['horizontal_hint'] = self._horizontal_hint
-
-        return result
-
-
-class LetterField(Field):
-    def __init__(self, letter: str):
-        assert len(letter) <= 1
-
-        super().__init__(field_type=FieldType.LETTER)
-
-        self._letter = letter.lower()
-        self._revealed = False
-        self._user_letter = ""
-
-    def get_content(self) -> str:
-        return self._letter.upper()
-
-    def get_user_content(self) -> str:
-        return self._user_letter.upper()
-
-    def reveal(self):
-        self._revealed = True
-
-    def user_input(self, input_letter):
-        assert len(input_letter) <= 1
-        self._user_letter = input_letter.lower()
-
-    def is_revealed(self) -> bool:
-        return self._revealed
-
-    def serialize(self):
-        result = super().serialize()
-        result['letter'] = self._letter
-
-        return result
+def get_grid_score(target_density: float, solution_locations: list, stats: dict) -> tuple:
+    # higher is better: a fitting solution word first, then the density
+    # up to the target and the number of words
+    return (len(solution_locations) > 0, min(stats['density'], target_density), stats['words'])
 
 
 class Grid(object):
-    def __init__(self, width: int, height: int, lang_code: str, density=0.55, difficulty: int = 0):
+    def __init__(self, width: int, height: int, lang_code: str, density=0.55, difficulty: int = 0, backend: str = "greedy",
+                 serialized_grid: list = None, solution_locations: list = None, deadline: float = None,
+                 achieved_density: float = None, seed: int = None, attempts: int = 1,
+                 executor: concurrent.futures.Executor = None, stop_event=None, generated: tuple = None):
+        # backend "greedy" uses crossword_generator.create_word_grid,
+        # backend "backtracking" uses crossword_filler.fill_word_grid.
+        # deadline: time.time() timestamp, the generator returns the grid reached so far by then.
+        # attempts > 1 runs that many differently seeded generations in the executor (best
+        # a process pool) and keeps the best grid. Once a grid with a solution word reaches the
+        # target density, pending attempts are cancelled and stop_event (e.g. a multiprocessing
+        # manager Event) is set to stop the running ones.
+        # If a serialized grid is given, it is loaded instead of generating a new one. generated
+        # is an already generated (raw_grid, word_infos, solution_locations, density), e.g. from an archive
+        assert backend in ("greedy", "backtracking")
+        assert attempts == 1 or executor is not None
+
         self._width = width
         self._height = height
         self._lang_code = lang_code
         self._difficulty = difficulty
         self._density = density
-        self._grid = []
+        self._backend = backend
+        self._deadline = deadline
+        self._achieved_density = achieved_density
+        self._seed = seed
+        self._attempts = attempts
+        self._executor = executor
+        self._stop_event = stop_event
         self._solution_locations = None
+
+        # grid state as flat arrays indexed by y * width + x instead of one object per cell:
+        # the FieldType value, the lower case solution letter and user input as code points
+        # (0 if none) and the revealed flag. Hints are a side table (y, x) -> [horizontal_hint, vertical_hint]
+        n_cells = width * height
+        self._cell_types = bytearray([FieldType.EMPTY.value]) * n_cells
+        self._letters = array.array('I', [0]) * n_cells
+        self._user_letters = array.array('I', [0]) * n_cells
+        self._revealed = bytearray(n_cells)
+        self._hints = {}
+        self._word_spans = []
+        self._cell_words = array.array('i', [-1]) * (2 * n_cells)
+        self._init_counters()
+
+        if serialized_grid is not None:
+            self._load_grid(serialized_grid, solution_locations)
+            return
+
+        if generated is not None:
+            self._fill_grid(*generated)
+            return
+
         try:
             self._build_grid()
         except Exception as e:
-            logging.error("error in generation", str(e))
+            logging.error("error in generation: %s", str(e))
             traceback.print_exc()
 
+    def _view(self, cells, dtype) -> np.ndarray:
+        # numpy (height, width) view on one of the flat state arrays, for whole grid operations
+        return np.frombuffer(cells, dtype=dtype).reshape(self._height, self._width)
+
     def serialize(self):
-        return [
-            [cell.serialize() for cell in row] for row in self._grid
-        ]
+        grid = []
+        for y in range(self._height):
+            row = []
+            for x in range(self._width):
+                i = y * self._width + x
+                cell_type = self._cell_types[i]
+                if cell_type == FieldType.LETTER.value:
+                    row.append({
+                        'cell_type': "letter",
+                        'letter': chr(self._letters[i])
+                    })
+                elif cell_type == FieldType.HINT.value:
+                    horizontal_hint, vertical_hint = self._hints[(y, x)]
+                    row.append({
+                        'cell_type': "hint",
+                        'vertical_hint': vertical_hint,
+                        'horizontal_hint': horizontal_hint
+                    })
+                else:
+                    row.append({
+                        'cell_type': "empty"
+                    })
+            grid.append(row)
+        return grid
+
+    def serialize_compact(self) -> dict:
+        # compact wire format: one string per row with the letter of letter cells, '#' for
+        # hint and ' ' for empty cells, and the (horizontal, vertical) hints of all hint
+        # cells in row major order as flat list
+        cell_types = self._view(self._cell_types, np.uint8)
+        chars = np.where(cell_types == FieldType.LETTER.value,
+                         self._view(self._letters, np.uint32),
+                         np.where(cell_types == FieldType.HINT.value, ord("#"), ord(" "))).astype(np.uint32)
+
+        hints = []
+        for i in np.flatnonzero(cell_types == FieldType.HINT.value).tolist():
+            hints += self._hints[divmod(i, self._width)]
+
+        return {
+            'rows': chars.view(f"<U{self._width}").ravel().tolist(),
+            'hints': hints
+        }
 
     def get_status(self):
+        # revealed cells and cells with user input, in row major order
+        is_set = self._view(self._revealed, np.uint8) | (self._view(self._user_letters, np.uint32) != 0)
+
         status = []
-        for y, row in enumerate(self._grid):
-            for x, cell in enumerate(row):
-                if cell.get_type() == FieldType.LETTER:
-
-                    user_content = cell.get_user_content()
-                    if cell.is_revealed():
-                        status.append({
-                            'x': x,
-                            'y': y,
-                            'revealed': cell.get_content()
-                        })
-                    elif len(user_content) > 0:
-                        status.append({
-                            'x': x,
-                            'y': y,
-                            'user_input': user_content
-                        })
+        for i in np.flatnonzero(is_set).tolist():
+            y, x = divmod(i, self._width)
+            if self._revealed[i]:
+                status.append({
+                    'x': x,
+                    'y': y,
+                    'revealed': chr(self._letters[i]).upper()
+                })
+            else:
+                status.append({
+                    'x': x,
+                    'y': y,
+                    'user_input': chr(self._user_letters[i]).upper()
+                })
         return status
 
-    def check_and_reveal_horizontal(self, x: int, y: int) -> list:
-        # TODO: this would be much more perfomant and elegant, if every cell would hold a reference
-        # to it's own word^^
-
-        status_update = []
-        cells_to_reveal = []
-
-        x_start = x
-        while (self._grid[y][x_start-1].get_type() == FieldType.LETTER):
-            x_start -= 1
-
-        x_i = x_start - 1
-        while(x_i + 1 < self._width and self._grid[y][x_i+1].get_type() == FieldType.LETTER):
+    def _build_word_spans(self):
+        # every maximal run of at least two letter cells is a word. self._word_spans holds
+        # (y, x, length, is_vertical) per word id, self._cell_words[2 * i + is_vertical] the ids
+        # of the horizontal and vertical word going through cell i (-1 if there is none)
+        self._word_spans = []
+        self._cell_words = array.array('i', [-1]) * (2 * self._width * self._height)
+
+        cell_types = self._view(self._cell_types, np.uint8)
+        for is_vertical in (False, True):
+            n_lanes, n_cells = (self._width, self._height) if is_vertical else (self._height, self._width)
+            lanes = cell_types.T if is_vertical else cell_types
+            is_letter = (lanes == FieldType.LETTER.value).tolist()
+            for lane in range(n_lanes):
+                i = 0
+                while i < n_cells:
+                    start = i
+                    while i < n_cells and is_letter[lane][i]:
+                        i += 1
+                    if i - start >= 2:
+                        word_id = len(self._word_spans)
+                        y, x = (start, lane) if is_vertical else (lane, start)
+                        self._word_spans.append((y, x, i - start, is_vertical))
+                        for k in range(start, i):
+                            cy, cx = (k, lane) if is_vertical else (lane, k)
+                            self._cell_words[2 * (cy * self._width + cx) + int(is_vertical)] = word_id
+                    i += 1
+
+        self._init_counters()
+
+    def _init_counters(self):
+        # number of correctly entered letters per word, in the solution word and overall.
+        # Updated whenever a cell's correctness changes, a word is solved once its counter
+        # reaches the word's length
+        self._word_lengths = [length for _, _, length, _ in self._word_spans]
+        self._word_correct = [0] * len(self._word_spans)
+        self._n_solved_words = 0
+
+        self._is_solution_cell = bytearray(self._width * self._height)
+        for y, x in self._solution_locations or []:
+            self._is_solution_cell[y * self._width + x] = 1
+        self._solution_correct = 0
+
+        is_letter = self._view(self._cell_types, np.uint8) == FieldType.LETTER.value
+        self._n_letters = int(np.count_nonzero(is_letter))
+        self._n_correct_letters = 0
+
+        is_correct = is_letter & (self._view(self._user_letters, np.uint32) == self._view(self._letters, np.uint32))
+        for i in np.flatnonzero(is_correct).tolist():
+            self._update_counters(i, 1)
+
+    def _update_counters(self, i: int, delta: int):
+        # i: cell index, delta: 1 if the cell became correct, -1 if it is not correct anymore
+        self._n_correct_letters += delta
+
+        for word_id in (self._cell_words[2 * i], self._cell_words[2 * i + 1]):
+            if word_id < 0:
+                continue
+            was_solved = self._word_correct[word_id] == self._word_lengths[word_id]
+            self._word_correct[word_id] += delta
+            is_solved = self._word_correct[word_id] == self._word_lengths[word_id]
+            self._n_solved_words += int(is_solved) - int(was_solved)
+
+        if self._is_solution_cell[i]:
+            self._solution_correct += delta
+
+    def get_progress(self) -> dict:
+        return {
+            'letters': self._n_letters,
+            'correct_letters': self._n_correct_letters,
+            'words': len(self._word_spans),
+            'solved_words': self._n_solved_words,
+            'solution_letters': len(self._solution_locations or []),
+            'correct_solution_letters': self._solution_correct,
+            'percent': 100 * self._n_correct_letters // max(self._n_letters, 1)
+        }
 
-            x_i += 1
-            cell = self._grid[y][x_i]
-            if cell.get_user_content() != cell.get_content():
-                return []
-            cells_to_reveal.append(cell)
+    def _get_word_cells(self, word_id: int) -> list:
+        y, x, length, is_vertical = self._word_spans[word_id]
+        if is_vertical:
+            return [(y + i, x) for i in range(length)]
+        return [(y, x + i) for i in range(length)]
 
-        if x_start - x_i == 0:
-            # we have a single letter, not a word
+    def _check_and_reveal_span(self, word_id: int) -> list:
+        if word_id < 0:
+            # a single letter, not a word
             return []
 
-        for i, cell in enumerate(cells_to_reveal):
-            status_update.append({
-                'x': x_start + i,
-                'y': y,
-                'revealed': cell.get_content()
-            })
-            cell.reveal()
-
-        return status_update
-
-    def check_and_reveal_vertical(self, x: int, y: int) -> list:
-        # TODO: this would be much more perfomant and elegant, if every cell would hold a reference
-        # to it's own word^^
-
-        status_update = []
-        cells_to_reveal = []
-
-        y_start = y
-        while (self._grid[y_start - 1][x].get_type() == FieldType.LETTER):
-            y_start -= 1
-
-        y_i = y_start - 1
-        while(y_i + 1 < self._width and self._grid[y_i+1][x].get_type() == FieldType.LETTER):
-
-            y_i += 1
-            cell = self._grid[y_i][x]
-            if cell.get_user_content() != cell.get_content():
-                return []
-            cells_to_reveal.append(cell)
-
-        if y_start - y_i == 0:
-            # we have a single letter, not a word
+        if self._word_correct[word_id] != self._word_lengths[word_id]:
             return []
 
-        for i, cell in enumerate(cells_to_reveal):
+        status_update = []
+        for y, x in self._get_word_cells(word_id):
+            i = y * self._width + x
             status_update.append({
                 'x': x,
-                'y': y_start + i,
-                'revealed': cell.get_content()
+                'y': y,
+                'revealed': chr(self._letters[i]).upper()
             })
-            cell.reveal()
+            self._revealed[i] = 1
 
         return status_update
 
-    def check_and_reveal_word(self, x: int, y: int):
-        grid_update = self.check_and_reveal_horizontal(
-            x, y) + self.check_and_reveal_vertical(x, y)
-
-        # check also the solution locations
-
-        is_solution_cell = False
-        for location in self._solution_locations:
-            ly = location[0]
-            lx = location[1]
+    def check_and_reveal_horizontal(self, x: int, y: int) -> list:
+        return self._check_and_reveal_span(self._cell_words[2 * (y * self._width + x)])
 
-            if lx == x and ly == y:
-                is_solution_cell = True
-            cell = self._grid[ly][lx]
-            if cell.get_user_content() != cell.get_content():
-                # not solved, nothing to do, return only grid update
-                return grid_update
+    def check_and_reveal_vertical(self, x: int, y: int) -> list:
+        return self._check_and_reveal_span(self._cell_words[2 * (y * self._width + x) + 1])
 
-        if not is_solution_cell:
-            return grid_update
+    def _check_and_reveal_solution(self) -> list:
+        if self._solution_correct != len(self._solution_locations):
+            return []
 
         solution_updates = []
         for location in self._solution_locations:
             ly = location[0]
             lx = location[1]
 
+            i = ly * self._width + lx
             solution_updates.append({
                 'x': lx,
                 'y': ly,
-                'revealed': self._grid[ly][lx].get_content()
+                'revealed': chr(self._letters[i]).upper()
             })
-            self._grid[ly][lx].reveal()
-        return grid_update + solution_updates
+            self._revealed[i] = 1
+        return solution_updates
 
-    def user_input(self, x: int, y: int, letter: str) -> list:
+    def check_and_reveal_word(self, x: int, y: int):
+        grid_update = self.check_and_reveal_horizontal(
+            x, y) + self.check_and_reveal_vertical(x, y)
+
+        # check also the solution locations
+        if not self._is_solution_cell[y * self._width + x]:
+            return grid_update
+
+        return grid_update + self._check_and_reveal_solution()
+
+    def _input_letter(self, x: int, y: int, letter: str) -> dict:
+        # sets a cell's user input without checking its words. Returns the cell's update,
+        # or None if nothing changed: no letter cell, an already revealed cell or the same letter
         assert len(letter) <= 1
 
-        cell = self._grid[y][x]
+        i = y * self._width + x
 
-        if cell.get_type() != FieldType.LETTER:
+        if not (0 <= x < self._width and 0 <= y < self._height) or self._cell_types[i] != FieldType.LETTER.value:
             # should not happen if the client does everything right
             logging.warning("try to modify wrong cell")
-            return []
+            return None
 
-        if cell.is_revealed():
-            # user tries to modify already revealed change, telling him it's already revealed ;)
-            return [{
-                'x': x,
-                'y': y,
-                'revealed': cell.get_content()
-            }]
+        if self._revealed[i]:
+            # the client does not send input for revealed cells, it already got the revealed letter
+            return None
 
         letter = letter.lower()
+        user_letter = ord(letter) if len(letter) > 0 else 0
+        if user_letter == self._user_letters[i]:
+            return None
 
-        cell.user_input(letter.lower())
+        was_correct = self._user_letters[i] == self._letters[i]
+        self._user_letters[i] = user_letter
+        is_correct = user_letter == self._letters[i]
+
+        if is_correct != was_correct:
+            self._update_counters(i, 1 if is_correct else -1)
+
+        return {
+            'x': x,
+            'y': y,
+            'user_input': letter.upper()
+        }
+
+    def user_input(self, x: int, y: int, letter: str) -> list:
+        update = self._input_letter(x, y, letter)
+        if update is None:
+            return []
 
         revealed_changes = self.check_and_reveal_word(x, y)
 
-        if len(revealed_changes) == 0:
-            return [{
-                'x': x,
-                'y': y,
-                'user_input': cell.get_user_content()
-            }]
+        if len(revealed_changes) > 0:
+            return revealed_changes
 
-        return revealed_changes
+        return [update]
+
+    def batch_input(self, inputs: list) -> list:
+        # applies several (x, y, letter) inputs at once, checking each affected word only once.
+        # Returns the merged updates, the last one per cell
+        updates = {}
+        word_ids = {}
+        check_solution = False
+
+        for x, y, letter in inputs:
+            update = self._input_letter(x, y, letter)
+            if update is None:
+                continue
+
+            i = y * self._width + x
+            updates[i] = update
+
+            word_ids[self._cell_words[2 * i]] = None
+            word_ids[self._cell_words[2 * i + 1]] = None
+            check_solution = check_solution or self._is_solution_cell[i]
+
+        revealed_changes = []
+        for word_id in word_ids:
+            revealed_changes += self._check_and_reveal_span(word_id)
+        if check_solution:
+            revealed_changes += self._check_and_reveal_solution()
+
+        for update in revealed_changes:
+            updates[update['y'] * self._width + update['x']] = update
+
+        return list(updates.values())
 
     def get_solution_locations(self):
         return self._solution_locations
 
+    def is_generated(self) -> bool:
+        # False if the generation failed and the grid is empty
+        return self._solution_locations is not None
+
+    def get_achieved_density(self) -> float:
+        # letter density of the generated grid, without the additional hint row and column
+        return self._achieved_density
+
+    def _load_grid(self, serialized_grid: list, solution_locations: list):
+        self._solution_locations = solution_locations
+
+        for y, serialized_row in enumerate(serialized_grid):
+            for x, serialized_cell in enumerate(serialized_row):
+                cell_type = serialized_cell['cell_type']
+                i = y * self._width + x
+                if cell_type == "letter":
+                    self._cell_types[i] = FieldType.LETTER.value
+                    self._letters[i] = ord(serialized_cell['letter'].lower())
+                elif cell_type == "hint":
+                    self._cell_types[i] = FieldType.HINT.value
+                    self._hints[(y, x)] = [serialized_cell['horizontal_hint'], serialized_cell['vertical_hint']]
+
+        self._build_word_spans()
+
+    def _generate_best_of(self):
+        # runs the attempts in the executor and returns the best result
+        base_seed = self._seed if self._seed is not None else random.getrandbits(32)
+        pending = {self._executor.submit(generate_raw_grid,
+                                         self._backend,
+                                         self._width - 1,
+                                         self._height - 1,
+                                         self._lang_code,
+                                         self._density,
+                                         self._difficulty,
+                                         base_seed + i,
+                                         self._deadline,
+                                         self._stop_event) for i in range(self._attempts)}
+
+        best_result = None
+        best_score = None
+        while len(pending) > 0:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error("generation attempt failed: %s", str(e))
+                    continue
+
+                score = get_grid_score(self._density, result[2], result[3])
+                if best_score is None or score > best_score:
+                    best_result = result
+                    best_score = score
+
+            if best_score is not None and best_score[0] and best_score[1] >= self._density:
+                # good enough
+                break
+
+        if len(pending) > 0:
+            for future in pending:
+                future.cancel()
+            if self._stop_event is not None:
+                self._stop_event.set()
+
+        logging.info("best of %s attempts: %s", str(self._attempts), str(best_score))
+
+        if best_result is None:
+            raise crossword_generator.NoDataException
+        return best_result
+
     def _build_grid(self):
-        raw_grid, word_infos, solution_locations = crossword_generator.create_word_grid(self._width - 1,
-                                                                                        self._height - 1,
-                                                                                        lang_code=self._lang_code,
-                                                                                        target_density=self._density,
-                                                                                        difficulty=self._difficulty)
+        if self._attempts > 1:
+            raw_grid, word_infos, solution_locations, stats = self._generate_best_of()
+        else:
+            raw_grid, word_infos, solution_locations, stats = generate_raw_grid(self._backend,
+                                                                                self._width - 1,
+                                                                                self._height - 1,
+                                                                                self._lang_code,
+                                                                                self._density,
+                                                                                self._difficulty,
+                                                                                seed=self._seed,
+                                                                                deadline=self._deadline,
+                                                                                stop_event=self._stop_event)
+
+        logging.debug("generation timings: %s", str(stats.get('timings')))
+
+        self._fill_grid(raw_grid, word_infos, solution_locations, stats['density'])
+
+    def _fill_grid(self, raw_grid: np.ndarray, word_infos: dict, solution_locations: list, density: float):
+        # the hints are chosen first, so a failing hint lookup leaves the grid untouched
+        hints = []
+        for word, info in word_infos.items():
+            try:
+                hints.append((info, info.get_hint()))
+            except crossword_generator.NoDataException:
+                # no hint for this word, it is still part of the grid
+                logging.warning("no hint for word: %s", word)
 
+        self._achieved_density = density
         self._solution_locations = solution_locations
         # fix solution locations offsets
         for i in range(len(self._solution_locations)):
@@ -299,67 +517,89 @@ class Grid(object):
 
         # note: we will append an additional row and column, to have enough space to place hint fields
 
-        self._grid = [[Field()] * self._width]  # initialize with empty row
-
-        for y in range(self._height - 1):
-            row = [Field()]  # initialize row with empty column
-            for x in range(self._width - 1):
-                raw_cell = raw_grid[y, x]
-                if raw_cell == " ":
-                    row.append(Field())
-                else:
-                    row.append(LetterField(raw_cell))
-
-            self._grid.append(row)
+        # letters go to the grid shifted by one row and column
+        is_letter = raw_grid != " "
+        self._view(self._cell_types, np.uint8)[1:, 1:][is_letter] = FieldType.LETTER.value
+        letters = np.char.lower(raw_grid[is_letter])
+        self._view(self._letters, np.uint32)[1:, 1:][is_letter] = letters.view(np.uint32)
 
         # place hint fields:
-        for word, info in word_infos.items():
+        for info, hint in hints:
             y, x = info.get_hint_location()
             # correct offset
             y += 1
             x += 1
 
-            cell = self._grid[y][x]
+            i = y * self._width + x
 
-            # check if we already have a hint here:
-            if cell.get_type() == FieldType.HINT:
-                if info.is_vertical():
-                    cell.set_vertical_hint(info.get_hint())
-                else:
-                    cell.set_horizintal_hint(info.get_hint())
-            elif cell.get_type() == FieldType.LETTER:
+            if self._cell_types[i] == FieldType.LETTER.value:
                 # edge case: a word has "eaten up" another one, skipping that case
-                pass
+                continue
 
-            else:
-                if info.is_vertical():
-                    self._grid[y][x] = HintField(vertical_hint=info.get_hint())
-                else:
-                    self._grid[y][x] = HintField(
-                        horizontal_hint=info.get_hint())
+            self._cell_types[i] = FieldType.HINT.value
+            if (y, x) not in self._hints:
+                self._hints[(y, x)] = [None, None]
+            self._hints[(y, x)][int(info.is_vertical())] = hint
+
+        self._build_word_spans()
 
 
 class Crossword(object):
-    def __init__(self, width: int, height: int, lang_code: str = "en", difficulty: int = 0):
+    def __init__(self, width: int, height: int, lang_code: str = "en", difficulty: int = 0, serialized: dict = None,
+                 deadline: float = None, attempts: int = 1, executor: concurrent.futures.Executor = None,
+                 stop_event=None, generated: tuple = None, backend: str = "greedy"):
+        # serialized: output of serialize(), e.g. created in another process
+        # deadline, attempts, executor, stop_event, generated and backend: see Grid
         self._width = width
         self._height = height
         self._difficulty = difficulty
-        self._grid = Grid(width, height, lang_code, difficulty=difficulty)
+
+        if serialized is None:
+            self._grid = Grid(width, height, lang_code, difficulty=difficulty, backend=backend, deadline=deadline,
+                              attempts=attempts, executor=executor, stop_event=stop_event,
+                              generated=generated)
+        else:
+            self._grid = Grid(width, height, lang_code, difficulty=difficulty,
+                              serialized_grid=serialized['grid'],
+                              solution_locations=serialized['solution'],
+                              achieved_density=serialized.get('density'))
 
     def serialize(self):
         return {
             'w': self._width,
             'h': self._height,
             'grid': self._grid.serialize(),
-            'solution': self._grid.get_solution_locations()
+            'solution': self._grid.get_solution_locations(),
+            'density': self._grid.get_achieved_density()
         }
 
+    def serialize_compact(self):
+        # like serialize, in the compact wire format, see Grid.serialize_compact
+        result = {
+            'w': self._width,
+            'h': self._height,
+            'solution': [v for location in self._grid.get_solution_locations() or [] for v in location],
+            'density': self._grid.get_achieved_density()
+        }
+        result.update(self._grid.serialize_compact())
+        return result
+
     def user_input(self, x: int, y: int, letter: str) -> list:
         return self._grid.user_input(x=x, y=y, letter=letter)
 
+    def batch_input(self, inputs: list) -> list:
+        # inputs: list of (x, y, letter)
+        return self._grid.batch_input(inputs)
+
     def get_status(self) -> list:
         return self._grid.get_status()
 
+    def get_progress(self) -> dict:
+        return self._grid.get_progress()
+
+    def is_generated(self) -> bool:
+        return self._grid.is_generated()
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
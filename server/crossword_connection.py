@@ -1,10 +1,74 @@
+import asyncio
 import logging
+import random
+import time
 import uuid
 
 import datetime as dt
 
 from . import json_websockets
+from . import metrics
 from . import session
+from . import crossword as crossword_module
+
+# "json": one object per cell and update, "compact": see Crossword.serialize_compact and
+# crossword.pack_updates. Requested by the client in its register message
+WIRE_FORMATS = ("json", "compact")
+
+# message types counted separately in the metrics, others are counted as "other"
+MESSAGE_TYPES = ("register", "update", "batch_update")
+
+
+def get_update_message(wire_format: str, updates: list, progress: dict, version: int) -> dict:
+    if wire_format == "compact":
+        updates = crossword_module.pack_updates(updates)
+
+    return {
+        'type': 'update',
+        'updates': updates,
+        'progress': progress,
+        'version': version
+    }
+
+
+def parse_input(update) -> tuple:
+    # returns (x, y, letter) of a single letter input like {'x': 3, 'y': 5, 'letter': 'a'},
+    # or None if it is malformed. An empty letter clears the cell
+    if (not isinstance(update, dict) or not isinstance(update.get('x'), int)
+            or not isinstance(update.get('y'), int) or not isinstance(update.get('letter'), str)
+            or len(update['letter']) > 1):
+        return None
+    return (update['x'], update['y'], update['letter'])
+
+
+async def send_updates(sess: session.Session, updates: list, version: int):
+    # sends updates applied to the session's crossword to all its sockets. Encoded once per
+    # wire format and codec in use, sending only queues the message on each socket
+    t_start = time.perf_counter()
+    progress = sess.get_crossword().get_progress()
+
+    sockets = list(sess.get_sockets())
+    frames = {}
+    for connection in sockets:
+        wire_format = connection.get_wire_format()
+        codec = connection.get_codec()
+        key = (wire_format, codec.name)
+        if key not in frames:
+            frames[key] = codec.encode(get_update_message(wire_format, updates, progress, version))
+        await connection.send_encoded(frames[key])
+
+    metrics.BROADCAST_SOCKETS.observe(len(sockets))
+    metrics.BROADCAST_SECONDS.observe(time.perf_counter() - t_start)
+
+
+async def flush_updates_later(sess: session.Session):
+    try:
+        await asyncio.sleep(sess.flush_interval)
+        await send_updates(sess, sess.take_pending_updates(), sess.version)
+    except Exception as e:
+        logging.error("error flushing updates: %s", str(e))
+    finally:
+        sess.end_flush()
 
 
 class CrosswordConnection(json_websockets.JsonWebsocketConnection):
@@ -13,6 +77,21 @@ class CrosswordConnection(json_websockets.JsonWebsocketConnection):
 
     last_cleanup = None
 
+    puzzle_pool = None
+
+    crossword_worker = None
+
+    puzzle_archive = None
+
+    # generator backend for crosswords generated inline, "greedy" or "backtracking"
+    generator_backend = "greedy"
+
+    # seconds to collect updates of a session before sending them at once, 0 sends every update immediately
+    flush_interval = 0.0
+
+    # fraction of incoming messages logged on debug level
+    log_sample_rate = 0.01
+
     def clean_sessions():
         now = dt.datetime.utcnow()
         if CrosswordConnection.last_cleanup is None or (now - CrosswordConnection.last_cleanup).total_seconds() > 3600:
@@ -30,6 +109,10 @@ class CrosswordConnection(json_websockets.JsonWebsocketConnection):
         super().__init__(*args, **kwargs)
 
         self._session = None
+        self._wire_format = "json"
+
+    def get_wire_format(self) -> str:
+        return self._wire_format
 
     async def send_crossword(self, sessionId: str, lang: str = "en", difficulty: int = 0):
         if sessionId not in CrosswordConnection.sessions:
@@ -45,32 +128,91 @@ class CrosswordConnection(json_websockets.JsonWebsocketConnection):
             await self.send_error(msg="you are not registered to given session")
             return
 
-        crossword = sess.get_crossword(lang=lang, difficulty=difficulty)
-        await self.send({
-            'type': 'crossword',
-            'crossword': crossword.serialize()
-        })
+        crossword = await sess.get_crossword_async(lang=lang, difficulty=difficulty)
+        if crossword is None:
+            await self.send_error(msg="crossword could not be generated")
+            return
+
+        await self.send_encoded(sess.get_crossword_frame(self._wire_format, self.get_codec()))
 
         # sending also the status as update:
-        await self.send({
-            'type': 'update',
-            'updates': crossword.get_status()
-        })
+        await self.send(get_update_message(self._wire_format,
+                                           crossword.get_status(),
+                                           crossword.get_progress(),
+                                           sess.version))
+
+    async def send_missed_updates(self, sess: session.Session, version: int) -> bool:
+        # for a socket reconnecting with the version it has seen last, sends only the
+        # updates it missed. Returns False if the whole crossword has to be sent instead
+        if not sess.has_crossword():
+            return False
+
+        updates = sess.get_updates_since(version)
+        if updates is None:
+            return False
+
+        await self.send(get_update_message(self._wire_format,
+                                           updates,
+                                           sess.get_crossword().get_progress(),
+                                           sess.version))
+        return True
+
+    async def user_update(self, update: dict):
+        parsed_input = parse_input(update)
+        if parsed_input is None:
+            await self.send_error(msg="received invalid userinput")
+            return
+
+        if not self._session.has_crossword():
+            await self.send_error(msg="crossword is not ready yet")
+            return
+
+        x, y, letter = parsed_input
+        crossword = self._session.get_crossword()
+        await self.broadcast_updates(crossword.user_input(x=x, y=y, letter=letter))
 
-    async def user_update(self, x: int, y: int, letter: str):
-        if len(letter) > 1:
+    async def user_batch_update(self, updates: list):
+        # several letters at once, e.g. a whole word, sent to the session as one update
+        if not isinstance(updates, list):
             await self.send_error(msg="received invalid userinput")
             return
 
-        update_message = self._session.get_crossword().user_input(x=x, y=y, letter=letter)
+        inputs = []
+        for update in updates:
+            parsed_input = parse_input(update)
+            if parsed_input is None:
+                await self.send_error(msg="received invalid userinput")
+                return
+            inputs.append(parsed_input)
+
+        if not self._session.has_crossword():
+            await self.send_error(msg="crossword is not ready yet")
+            return
+
+        crossword = self._session.get_crossword()
+        await self.broadcast_updates(crossword.batch_input(inputs))
 
-        for connection in self._session.get_sockets():
-            await connection.send({
-                'type': 'update',
-                'updates': update_message
-            })
+    async def broadcast_updates(self, update_message: list):
+        # sends updates applied to the session's crossword to all its sockets, or collects
+        # them until the end of the session's flush interval
+        if len(update_message) == 0:
+            # the input changed nothing, e.g. an unchanged letter or an already revealed cell
+            return
 
-    async def register(self, sessionId: str = None, lang: str = "en", difficulty: int = 0):
+        version = self._session.add_updates(update_message)
+
+        if self._session.flush_interval <= 0:
+            await send_updates(self._session, update_message, version)
+            return
+
+        if self._session.add_pending_updates(update_message):
+            self._session.flush_task = asyncio.ensure_future(flush_updates_later(self._session))
+
+    async def register(self, sessionId: str = None, lang: str = "en", difficulty: int = 0, version: int = None,
+                       wire_format: str = "json"):
+        # version: the last version a reconnecting socket has seen of this session
+        # wire_format: one of WIRE_FORMATS, used for all messages to this socket
+        self._wire_format = wire_format
 
         if sessionId is None:
 
@@ -78,14 +220,18 @@ class CrosswordConnection(json_websockets.JsonWebsocketConnection):
             while sessionId in CrosswordConnection.sessions:
                 sessionId = uuid.uuid4().hex
 
-            new_session = session.Session()
+            new_session = session.Session(puzzle_pool=CrosswordConnection.puzzle_pool,
+                                          crossword_worker=CrosswordConnection.crossword_worker,
+                                          puzzle_archive=CrosswordConnection.puzzle_archive,
+                                          flush_interval=CrosswordConnection.flush_interval,
+                                          backend=CrosswordConnection.generator_backend)
             CrosswordConnection.sessions[sessionId] = new_session
 
         if sessionId not in CrosswordConnection.sessions:
             await self.send_error("unknown session id")
 
             # register with new id:
-            await self.register(lang=lang, difficulty=difficulty)
+            await self.register(lang=lang, difficulty=difficulty, wire_format=wire_format)
             return
 
         sess = CrosswordConnection.sessions[sessionId]
@@ -98,7 +244,8 @@ class CrosswordConnection(json_websockets.JsonWebsocketConnection):
             'sessionId': sessionId
         })
 
-        await self.send_crossword(sessionId, lang=lang, difficulty=difficulty)
+        if version is None or not await self.send_missed_updates(sess, version):
+            await self.send_crossword(sessionId, lang=lang, difficulty=difficulty)
 
         # clean up old session
         CrosswordConnection.clean_sessions()
@@ -110,7 +257,21 @@ class CrosswordConnection(json_websockets.JsonWebsocketConnection):
         })
 
     async def handle_message(self, message: dict):
-        logging.info("incoming message: %s", str(message))
+        t_start = time.perf_counter()
+        message_type = message.get('type') if isinstance(message, dict) else None
+        if message_type not in MESSAGE_TYPES:
+            message_type = "other"
+
+        if random.random() < CrosswordConnection.log_sample_rate:
+            logging.debug("incoming message: %s", str(message))
+
+        try:
+            await self._handle_message(message)
+        finally:
+            metrics.MESSAGES.inc(message_type)
+            metrics.HANDLE_MESSAGE_SECONDS.observe(time.perf_counter() - t_start, message_type)
+
+    async def _handle_message(self, message: dict):
         if not "type" in message:
             logging.error("received malformated message")
             await self.send_error(msg="i do not understand the request")
@@ -120,13 +281,20 @@ class CrosswordConnection(json_websockets.JsonWebsocketConnection):
             sessionId = None
             lang = "en"
             difficulty = 0
+            version = None
+            wire_format = "json"
             if 'sessionId' in message:
                 sessionId = message['sessionId']
             if "lang" in message:
                 lang = message['lang']
             if "difficulty" in message:
                 difficulty = message["difficulty"]
-            await self.register(sessionId=sessionId, lang=lang, difficulty=difficulty)
+            if "version" in message and isinstance(message["version"], int):
+                version = message["version"]
+            if message.get("format") in WIRE_FORMATS:
+                wire_format = message["format"]
+            await self.register(sessionId=sessionId, lang=lang, difficulty=difficulty, version=version,
+                                wire_format=wire_format)
             return
 
         if self._session is None:
@@ -134,5 +302,14 @@ class CrosswordConnection(json_websockets.JsonWebsocketConnection):
             return
 
         if message['type'] == "update":
-            await self.user_update(x=message['x'], y=message['y'], letter=message['letter'])
+            await self.user_update(message)
+            return
+
+        if message['type'] == "batch_update":
+            await self.user_batch_update(updates=message.get('updates'))
             return
+
+
+metrics.ACTIVE_SESSIONS.set_function(lambda: len(CrosswordConnection.sessions))
+metrics.ACTIVE_SOCKETS.set_function(lambda: sum(1 for sess in CrosswordConnection.sessions.values()
+                                                for socket in sess.connected_sockets if not socket.is_closed()))
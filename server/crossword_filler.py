@@ -0,0 +1,251 @@
+import random
+import time
+import logging
+
+from . import crossword_generator
+from . import letter_grid
+
+
+class _Frame(object):
+    # one search node: the slot chosen at this depth and the words still to try for it
+    def __init__(self, slot: tuple, candidates: list):
+        self.slot = slot
+        self.candidates = candidates
+        self.next_candidate = 0
+
+    def is_exhausted(self) -> bool:
+        return self.next_candidate >= len(self.candidates)
+
+
+def fill_word_grid(w: int,
+                   h: int,
+                   lang_code: str = "en",
+                   target_density: float = 0.5,
+                   difficulty: int = 0,
+                   max_nodes: int = 5000,
+                   time_limit: float = 1.0,
+                   max_slots: int = 40,
+                   max_branching: int = 4,
+                   seed: int = None,
+                   stats: dict = None,
+                   deadline: float = None,
+                   stop_event=None):
+    # backtracking alternative to crossword_generator.create_word_grid, returning the same
+    # (grid, word_hints, solution_locations) triple. Words are placed slot by slot, choosing
+    # the most constrained of the longest open slots first. A placement is undone immediately
+    # if a new letter of it is crossed by open slots, none of which has a matching word left
+    # (forward checking), dead ends are backtracked. When the node or time budget runs out, the densest grid seen so far is returned.
+    # seed, stats, deadline and stop_event work like for create_word_grid,
+    # time_limit applies in any case
+
+    logging.info("fill new crossword with params: w:%s h:%s lang:%s density:%s difficulty:%s",
+                 str(w),
+                 str(h),
+                 lang_code,
+                 str(target_density),
+                 str(difficulty))
+
+    rng = random.Random(seed)
+
+    word_index = crossword_generator.get_word_index(lang=lang_code)
+    pattern_index = crossword_generator.get_pattern_index(lang=lang_code)
+
+    grid = letter_grid.LetterGrid(h, w)
+
+    min_shape = min(w, h, 30)
+
+    # normalized words already in the grid
+    used_words = set()
+
+    # stack of placements: (word, y, x, is_vertical, new_cells)
+    placements = []
+
+    def place(word: str, y: int, x: int, is_vertical: bool):
+        normalized_word = crossword_generator.normalize_word(word)
+        new_cells = grid.place(normalized_word, y, x, is_vertical)
+        used_words.add(normalized_word)
+        placements.append((word, y, x, is_vertical, new_cells))
+
+    def undo():
+        word, _, _, _, new_cells = placements.pop()
+        grid.remove(new_cells)
+        used_words.remove(crossword_generator.normalize_word(word))
+
+    # pattern -> matching words, the same patterns come up again and again while searching
+    pattern_words = {}
+
+    def find_words(y: int, x: int, n: int, is_vertical: bool) -> list:
+        pattern = grid.get_pattern(y, x, n, is_vertical)
+        words = pattern_words.get(pattern)
+        if words is None:
+            words = pattern_index.find_words(pattern, difficulty)
+            pattern_words[pattern] = words
+        return words
+
+    def get_domain(y: int, x: int, n: int, is_vertical: bool) -> list:
+        return [word for word in find_words(y, x, n, is_vertical)
+                if crossword_generator.normalize_word(word) not in used_words]
+
+    def has_candidate(y: int, x: int, n: int, is_vertical: bool) -> bool:
+        return any(crossword_generator.normalize_word(word) not in used_words
+                   for word in find_words(y, x, n, is_vertical))
+
+    def get_lengths() -> list:
+        density = grid.density()
+        max_length = max((1 - density ** 0.4) * min_shape, 6)
+        return word_index.get_lengths(difficulty, max_length=max_length, min_length=2)
+
+    def check_crossings(new_cells: list, is_vertical: bool) -> bool:
+        # forward checking: every open slot crossing a new letter of the word just placed
+        # is checked. Returns False if a new letter is crossed by open slots, but none of
+        # them has a matching word left
+        crossed = {}
+        for n in get_lengths():
+            ys, xs, verticals = grid.find_slots(n)
+            for y, x, v in zip(ys, xs, verticals):
+                y, x, v = int(y), int(x), bool(v)
+                if v == is_vertical:
+                    continue
+                for cell_y, cell_x, _ in new_cells:
+                    if v and y <= cell_y < y + n and x == cell_x:
+                        break
+                    if not v and x <= cell_x < x + n and y == cell_y:
+                        break
+                else:
+                    continue
+                if crossed.get((cell_y, cell_x)):
+                    continue
+                crossed[(cell_y, cell_x)] = has_candidate(y, x, n, v)
+
+        return all(crossed.values())
+
+    def expand():
+        # returns the frame for the most constrained open slot or None, if there is no
+        # open slot with a matching word left
+        slots = []
+        for n in get_lengths():
+            ys, xs, verticals = grid.find_slots(n)
+            slots += [(int(y), int(x), n, bool(v)) for y, x, v in zip(ys, xs, verticals)]
+
+        rng.shuffle(slots)
+
+        # long slots first, since they add the most letters. Among slots of the same
+        # length the most constrained one (fewest matching words) is filled first
+        best_slot = None
+        best_domain = None
+        for slot in slots[:max_slots]:
+            domain = get_domain(*slot)
+            if len(domain) == 0:
+                continue
+            if best_domain is None or (-slot[2], len(domain)) < (-best_slot[2], len(best_domain)):
+                best_slot = slot
+                best_domain = domain
+
+        if best_slot is None:
+            return None
+
+        rng.shuffle(best_domain)
+        return _Frame(best_slot, best_domain[:max_branching])
+
+    # place first word like the greedy generator does:
+    first_word = word_index.get_word(difficulty,
+                                     max_length=min_shape,
+                                     min_length=min(10, min_shape - 2),
+                                     rng=rng)
+    x = rng.randint(0, w - len(crossword_generator.normalize_word(first_word)) - 1)
+    y = rng.randint(0, h - 1)
+    place(first_word, y, x, False)
+
+    best_density = grid.density()
+    best_placements = [p[:4] for p in placements]
+
+    t_end = time.time() + time_limit
+    if deadline is not None:
+        t_end = min(t_end, deadline)
+    n_nodes = 0
+
+    stack = []
+    frame = expand()
+    backjump = 1
+
+    while grid.density() < target_density:
+        if n_nodes >= max_nodes or time.time() > t_end:
+            logging.info("filling budget exhausted")
+            break
+
+        if stop_event is not None and stop_event.is_set():
+            logging.info("crossword filling stopped")
+            break
+
+        if frame is None or frame.is_exhausted():
+            # dead end, backtrack. Consecutive dead ends jump back further each time,
+            # so the search does not get stuck retrying the last few words
+            if len(stack) == 0:
+                break
+            for _ in range(max(min(backjump, len(stack) // 2), 1)):
+                frame = stack.pop()
+                undo()
+            backjump *= 2
+            continue
+
+        word = frame.candidates[frame.next_candidate]
+        frame.next_candidate += 1
+
+        y, x, n, is_vertical = frame.slot
+        place(word, y, x, is_vertical)
+        n_nodes += 1
+
+        if not check_crossings(placements[-1][4], is_vertical):
+            undo()
+            continue
+
+        if grid.density() > best_density:
+            best_density = grid.density()
+            best_placements = [p[:4] for p in placements]
+            backjump = 1
+
+        if grid.density() >= target_density:
+            break
+
+        # keep the placement only if the grid can still grow
+        next_frame = expand()
+        if next_frame is None:
+            undo()
+            continue
+
+        stack.append(frame)
+        frame = next_frame
+
+    if stats is not None:
+        stats['iterations'] = n_nodes
+        stats['words'] = len(best_placements)
+        stats['density'] = best_density
+
+    logging.info("crossword filling done after %s nodes, density: %s", str(n_nodes), str(best_density))
+
+    return build_result(w, h, lang_code, difficulty, best_placements, rng)
+
+
+def build_result(w: int, h: int, lang_code: str, difficulty: int, placements: list, rng: random.Random = random):
+    # builds the (grid, word_hints, solution_locations) triple from a list
+    # of placements (word, y, x, is_vertical)
+    word_index = crossword_generator.get_word_index(lang=lang_code)
+    opposite_prefix, synonym_prefix = crossword_generator.get_hint_prefixes(lang_code)
+
+    grid = letter_grid.LetterGrid(h, w)
+    locations = {}
+    word_hints = {}
+
+    for word, y, x, is_vertical in placements:
+        normalized_word = crossword_generator.normalize_word(word)
+        for char_y, char_x, char in grid.place(normalized_word, y, x, is_vertical):
+            if char not in locations:
+                locations[char] = []
+            locations[char].append([char_y, char_x])
+
+        word_hints[normalized_word] = crossword_generator.WordInfo(
+            word, y, x, is_vertical, lang_code, opposite_prefix, synonym_prefix, rng)
+
+    solution_locations = crossword_generator.get_solution_word(word_index, difficulty, locations, rng=rng)
+
+    return grid.to_chars(), word_hints, solution_locations
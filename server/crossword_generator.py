@@ -1,10 +1,15 @@
-import json
+import os
 import random
+import bisect
+import math
+import time
 import numpy as np
-from string import digits
 import pathlib
 import logging
 
+from . import letter_grid
+from . import word_database
+
 
 def get_difficulty_threshold(lang: str, difficulty: int):
     return get_difficulty_threshold.thresholds[lang][difficulty]
@@ -24,16 +29,20 @@ get_difficulty_threshold.thresholds = {
 }
 
 
-def get_database(lang: str = "en") -> dict:
+def get_database(lang: str = "en") -> word_database.WordDatabase:
     if lang not in get_database._dbs:
         current_folder = pathlib.Path(__file__).parents[0]
-        db_file = str(current_folder / f"{lang}.json")
+        json_file = str(current_folder / f"{lang}.json")
+        db_file = str(current_folder / f"{lang}.db")
+
+        # the binary database is generated from the json dictionary once
+        if not os.path.exists(db_file) or (os.path.exists(json_file) and
+                                           os.path.getmtime(json_file) > os.path.getmtime(db_file)):
+            word_database.build_database(json_file, db_file)
 
         logging.info("loading database: %s", lang)
 
-        with open(db_file, "r") as f:
-            db = json.load(f)
-            get_database._dbs[lang] = db
+        get_database._dbs[lang] = word_database.WordDatabase(db_file)
 
         logging.info("database loaded")
 
@@ -43,74 +52,324 @@ def get_database(lang: str = "en") -> dict:
 get_database._dbs = {}
 
 
+normalize_word = word_database.normalize_word
+
+
 class NoDataException(Exception):
     pass
 
 
+class WordIndex(object):
+    def __init__(self, database: word_database.WordDatabase, thresholds: dict):
+        # ids of all usable words sorted by normalized length and, inside each length bucket,
+        # by descending number of translations. So for every difficulty the eligible
+        # words of one length are a prefix of that length's bucket
+        self._database = database
+        self._thresholds = thresholds
+        self._letter_count_indices = {}
+
+        lengths = database.get_normalized_lengths()
+        num_translations = database.get_num_translations()
+
+        # words without antonyms, synonyms or senses can not get a hint
+        n_hints = sum(database.get_attribute_counts(attr) for attr in ("antonyms", "synonyms", "senses"))
+
+        usable = np.flatnonzero((lengths > 0) & (n_hints > 0))
+        order = np.lexsort((usable, -num_translations[usable].astype(np.int64), lengths[usable]))
+        self._word_ids = usable[order]
+
+        sorted_lengths = lengths[self._word_ids]
+        sorted_num_translations = num_translations[self._word_ids]
+        self._max_length = int(sorted_lengths[-1]) if len(sorted_lengths) > 0 else 0
+
+        # self._bucket_start[n]: index of the first word with normalized length n
+        self._bucket_start = np.searchsorted(sorted_lengths, np.arange(self._max_length + 2)).tolist()
+
+        # self._cumulative[difficulty][n]: number of eligible words shorter than n
+        self._cumulative = {}
+        for difficulty, t in thresholds.items():
+            cumulative = [0] * (self._max_length + 2)
+            for n in range(self._max_length + 1):
+                start = self._bucket_start[n]
+                end = self._bucket_start[n + 1]
+                # number of words in the bucket having at least t translations:
+                eligible = int(np.count_nonzero(sorted_num_translations[start:end] >= t))
+                cumulative[n + 1] = cumulative[n] + eligible
+            self._cumulative[difficulty] = cumulative
+
+    def _window(self, max_length: float, min_length: float):
+        # normalized lengths n with min_length < n < max_length
+        lo = max(int(math.floor(min_length)) + 1, 0)
+        hi = min(int(math.ceil(max_length)) - 1, self._max_length)
+        return lo, hi
+
+    def get_max_length(self) -> int:
+        return self._max_length
+
+    def get_bucket(self, n: int) -> list:
+        # all words with normalized length n, eligible ones first
+        if n > self._max_length:
+            return []
+        return [self._database.get_word(int(word_id))
+                for word_id in self._word_ids[self._bucket_start[n]:self._bucket_start[n + 1]]]
+
+    def get_bucket_size(self, n: int) -> int:
+        if n > self._max_length:
+            return 0
+        return self._bucket_start[n + 1] - self._bucket_start[n]
+
+    def get_bucket_word(self, n: int, i: int) -> str:
+        return self._database.get_word(int(self._word_ids[self._bucket_start[n] + i]))
+
+    def count_eligible(self, difficulty: int, n: int) -> int:
+        if n > self._max_length:
+            return 0
+        cumulative = self._cumulative[difficulty]
+        return cumulative[n + 1] - cumulative[n]
+
+    def get_lengths(self, difficulty: int, max_length: float, min_length: float = 0) -> list:
+        # all normalized lengths inside the window having eligible words
+        lo, hi = self._window(max_length, min_length)
+        return [n for n in range(lo, hi + 1) if self.count_eligible(difficulty, n) > 0]
+
+    def get_word(self, difficulty: int, max_length: float, min_length: float = 0, rng: random.Random = random) -> str:
+        lo, hi = self._window(max_length, min_length)
+        if lo > hi:
+            raise NoDataException
+
+        cumulative = self._cumulative[difficulty]
+        n_candidates = cumulative[hi + 1] - cumulative[lo]
+        if n_candidates <= 0:
+            raise NoDataException
+
+        # every eligible word in the window is equally likely, so the length
+        # buckets are implicitly weighted by their number of eligible words
+        r = cumulative[lo] + rng.randint(0, n_candidates - 1)
+        n = bisect.bisect_right(cumulative, r) - 1
+        return self._database.get_word(int(self._word_ids[self._bucket_start[n] + r - cumulative[n]]))
+
+    def get_letter_count_index(self, max_length: float, min_length: float = 0):
+        key = self._window(max_length, min_length)
+        if key not in self._letter_count_indices:
+            lo, hi = key
+            word_ids = self._word_ids[self._bucket_start[lo]:self._bucket_start[hi + 1]] if lo <= hi else []
+            self._letter_count_indices[key] = LetterCountIndex(self._database, word_ids, self._thresholds)
+        return self._letter_count_indices[key]
+
+
+class LetterCountIndex(object):
+    # letter multisets of a set of words: one row per word holding how often each letter
+    # occurs in the normalized word. A word can be spelled from the letters of a grid,
+    # if no row entry exceeds the grid's letter histogram
+    def __init__(self, database: word_database.WordDatabase, word_ids: np.ndarray, thresholds: dict):
+        self._database = database
+
+        # rows sorted by descending number of translations, so the eligible
+        # words of every difficulty are a prefix
+        num_translations = database.get_num_translations()[word_ids].astype(np.int64)
+        order = np.argsort(-num_translations, kind="stable")
+        self._word_ids = np.asarray(word_ids)[order]
+        num_translations = num_translations[order]
+
+        self._n_eligible = {difficulty: int(np.count_nonzero(num_translations >= t))
+                            for difficulty, t in thresholds.items()}
+
+        self._alphabet = {}
+        rows = []
+        for word_id in self._word_ids:
+            row = {}
+            for char in normalize_word(database.get_word(int(word_id))):
+                if char not in self._alphabet:
+                    self._alphabet[char] = len(self._alphabet)
+                column = self._alphabet[char]
+                row[column] = row.get(column, 0) + 1
+            rows.append(row)
+
+        self._counts = np.zeros(shape=(len(rows), len(self._alphabet)), dtype=np.uint8)
+        for i, row in enumerate(rows):
+            for column, count in row.items():
+                self._counts[i, column] = min(count, 255)
+
+        self._max_counts = self._counts.max(axis=0) if len(rows) > 0 else np.zeros(0, dtype=np.uint8)
+
+    def find_words(self, difficulty: int, histogram: dict) -> np.ndarray:
+        # returns the row numbers of all eligible words which can be spelled with
+        # the letters of the histogram (letter -> number of available cells)
+        counts = self._counts[:self._n_eligible[difficulty]]
+
+        available = np.zeros(len(self._alphabet), dtype=np.int64)
+        for char, column in self._alphabet.items():
+            available[column] = histogram.get(char, 0)
+
+        # only letters which could run short have to be checked
+        columns = np.flatnonzero(available < self._max_counts)
+        if len(columns) == 0:
+            return np.arange(len(counts))
+
+        fits = np.all(counts[:, columns] <= available[columns], axis=1)
+        return np.flatnonzero(fits)
+
+    def get_word(self, row: int) -> str:
+        return self._database.get_word(int(self._word_ids[row]))
+
+
+def get_word_index(lang: str = "en") -> WordIndex:
+    if lang not in get_word_index._indices:
+        logging.info("building word index: %s", lang)
+        get_word_index._indices[lang] = WordIndex(get_database(lang=lang),
+                                                  get_difficulty_threshold.thresholds[lang])
+        logging.info("word index built")
+
+    return get_word_index._indices[lang]
+
+
+get_word_index._indices = {}
+
+
+class PatternIndex(object):
+    def __init__(self, word_index: WordIndex):
+        # inverted index (length, position, letter) -> bitset over the words of
+        # that length, stored as packed numpy bit arrays. A bit's index is the word's
+        # position inside the length bucket of the word index
+        self._word_index = word_index
+        self._bitsets = {}
+        self._difficulty_bitsets = {}
+
+        for n in range(2, word_index.get_max_length() + 1):
+            bucket = word_index.get_bucket(n)
+            if len(bucket) == 0:
+                continue
+
+            letters = np.array([list(normalize_word(word)) for word in bucket], dtype='<U1')
+            for position in range(n):
+                column = letters[:, position]
+                for letter in np.unique(column):
+                    self._bitsets[(n, position, str(letter))] = np.packbits(column == letter,
+                                                                            bitorder='little')
+
+    def _get_difficulty_bitset(self, difficulty: int, n: int) -> np.ndarray:
+        # eligible words are a prefix of the length bucket
+        key = (difficulty, n)
+        if key not in self._difficulty_bitsets:
+            bucket_size = self._word_index.get_bucket_size(n)
+            n_eligible = self._word_index.count_eligible(difficulty, n)
+            self._difficulty_bitsets[key] = np.packbits(np.arange(bucket_size) < n_eligible,
+                                                        bitorder='little')
+        return self._difficulty_bitsets[key]
+
+    def find_words(self, pattern: str, difficulty: int, placeholder: str = '?') -> list:
+        # returns all eligible words matching a pattern like "??a?e"
+        n = len(pattern)
+        n_eligible = self._word_index.count_eligible(difficulty, n)
+        if n_eligible == 0:
+            return []
+
+        candidates = self._get_difficulty_bitset(difficulty, n)
+        for position, letter in enumerate(pattern):
+            if letter == placeholder:
+                continue
+            bitset = self._bitsets.get((n, position, letter))
+            if bitset is None:
+                return []
+            candidates = candidates & bitset
+
+        ids = np.flatnonzero(np.unpackbits(candidates, count=n_eligible, bitorder='little'))
+        return [self._word_index.get_bucket_word(n, i) for i in ids]
+
+
+def get_pattern_index(lang: str = "en") -> PatternIndex:
+    if lang not in get_pattern_index._indices:
+        logging.info("building pattern index: %s", lang)
+        get_pattern_index._indices[lang] = PatternIndex(get_word_index(lang=lang))
+        logging.info("pattern index built")
+
+    return get_pattern_index._indices[lang]
+
+
+get_pattern_index._indices = {}
+
+
 class WordInfo(object):
-    def __init__(self, word: str, y: int, x: int, is_vertical: bool, database: dict, opposite_prefix: str = "opposite of", synonym_prefix: str = "other word for"):
-        self._dictionary_database = database
+    # a placed word. The hint is only chosen and formatted on the first get_hint() call,
+    # i.e. when the grid actually gets a hint field for the word.
+    # Only plain values are stored, so word infos can be pickled and sent between processes
+    def __init__(self, word: str, y: int, x: int, is_vertical: bool, lang_code: str = "en", opposite_prefix: str = "opposite of", synonym_prefix: str = "other word for", rng: random.Random = random):
+        self._lang_code = lang_code
         self._y = y
         self._x = x
         self._word = word
+        self._word_id = None
         self._hint = None
         self._is_vertical = is_vertical
 
+        # the hint's random choices get their own generator, seeded from rng
+        self._seed = rng.getrandbits(32)
+        self._rng = None
+
         self.opposite_prefix = opposite_prefix
         self.synonym_prefix = synonym_prefix
 
-        self.choose_info()
+    def _get_database(self) -> word_database.WordDatabase:
+        return get_database(lang=self._lang_code)
+
+    def _get_rng(self) -> random.Random:
+        if self._rng is None:
+            self._rng = random.Random(self._seed)
+        return self._rng
+
+    def _get_word_id(self) -> int:
+        if self._word_id is None:
+            self._word_id = self._get_database().find(self._word)
+        return self._word_id
 
     def get_attribute(self, attr: str):
-        attr = self._dictionary_database[self._word][attr]
-        if attr is None or len(attr) == 0:
+        attr = self._get_database().get_attribute(self._get_word_id(), attr)
+        if len(attr) == 0:
             raise NoDataException
         return attr
 
+    def _get_random_item(self, attr: str) -> str:
+        n = self._get_database().count_attribute(self._get_word_id(), attr)
+        if n == 0:
+            raise NoDataException
+        return self._get_database().get_attribute_item(self._get_word_id(), attr, self._get_rng().randrange(n))
+
     def get_best_antonym(self) -> str:
-        antonyms = self.get_attribute("antonyms")
-        return random.choice(antonyms)
+        return self._get_random_item("antonyms")
 
     def get_best_synonym(self) -> str:
-        synonyms = self.get_attribute("synonyms")
-        return random.choice(synonyms)
+        return self._get_random_item("synonyms")
 
     def get_best_sense(self) -> str:
-        senses = self.get_attribute("senses")
-        return random.choice(senses)
+        return self._get_random_item("senses")
+
+    def _format_hint(self, i: int, counts: list) -> str:
+        # i indexes the virtual list antonyms + synonyms + senses
+        word_id = self._get_word_id()
+        n_antonyms, n_synonyms, _ = counts
+        if i < n_antonyms:
+            antonym = self._get_database().get_attribute_item(word_id, "antonyms", i)
+            return f"{self.opposite_prefix} {antonym}"
+        i -= n_antonyms
+        if i < n_synonyms:
+            synonym = self._get_database().get_attribute_item(word_id, "synonyms", i)
+            return f"{self.synonym_prefix} {synonym}"
+        i -= n_synonyms
+        return self._get_database().get_attribute_item(word_id, "senses", i)
 
     def choose_info(self, n: int = 1):
         assert n <= 4
-        # first choose antonyms, then synonyms, then senses
-
-        hints = []
-
-        try:
-            antonyms = self.get_attribute("antonyms")
-            antonyms = [f"{self.opposite_prefix} {w}" for w in antonyms]
-            hints = hints + antonyms
-        except NoDataException:
-            pass
-
-        try:
-            synonyms = self.get_attribute("synonyms")
-            synonyms = [f"{self.synonym_prefix} {w}" for w in synonyms]
-
-            hints = hints + synonyms
-        except NoDataException:
-            pass
-
-        try:
-            senses = self.get_attribute("senses")
-            hints = hints + senses
-        except NoDataException:
-            pass
+        # first choose antonyms, then synonyms, then senses. Only the counts are read,
+        # the chosen hints are the only strings decoded and formatted
+        word_id = self._get_word_id()
+        counts = [self._get_database().count_attribute(word_id, attr)
+                  for attr in ("antonyms", "synonyms", "senses")]
+
+        total = sum(counts)
+        if total < n:
+            raise NoDataException
 
-        final_hints = []
-        for i in range(n):
-            choice = random.choice(hints)
-            hints.remove(choice)
-            final_hints.append(choice)
+        final_hints = [self._format_hint(i, counts) for i in self._get_rng().sample(range(total), n)]
 
         if n == 1:
             self._hint = final_hints[0]
@@ -123,8 +382,16 @@ class WordInfo(object):
             self._hint += hint_symbols[i] + " " + final_hints[i] + ". "
 
     def get_hint(self) -> str:
+        if self._hint is None:
+            self.choose_info()
         return self._hint
 
+    def get_word(self) -> str:
+        return self._word
+
+    def get_location(self):
+        return (self._y, self._x)
+
     def get_hint_location(self):
         x = self._x if self._is_vertical else self._x - 1
         y = self._y - 1 if self._is_vertical else self._y
@@ -134,25 +401,88 @@ class WordInfo(object):
         return self._is_vertical
 
 
-def create_word_grid(w: int, h: int, lang_code: str = "en", target_density: float = 0.5, difficulty: int = 0):
-    logging.info("generate new crossword with params: w:%s h:%s lang:%s density:%s difficulty:%s",
+def get_solution_word(word_index: WordIndex, difficulty: int, locations: dict, min_length=8, max_length=100, rng: random.Random = random):
+    # chooses a random word which can be spelled with the letters in the grid and returns
+    # one distinct cell [y, x] per letter, or an empty list if there is no such word.
+    # locations maps each letter to the cells holding it and is not modified
+    letter_count_index = word_index.get_letter_count_index(max_length=max_length, min_length=min_length)
+
+    histogram = {char: len(cells) for char, cells in locations.items()}
+    candidates = letter_count_index.find_words(difficulty, histogram)
+    if len(candidates) == 0:
+        logging.warning("no solution word fits into the grid")
+        return []
+
+    word = normalize_word(letter_count_index.get_word(int(candidates[rng.randrange(len(candidates))])))
+
+    # draw the needed number of distinct cells for each letter
+    chosen_cells = {}
+    for char in dict.fromkeys(word):
+        chosen_cells[char] = rng.sample(locations[char], word.count(char))
+
+    return [list(chosen_cells[char].pop()) for char in word]
+
+
+def get_hint_prefixes(lang_code: str):
+    # returns Tuple of: (opposite_prefix, synonym_prefix)
+    if lang_code == "en":
+        return "opposite of", "other word for"
+    return "Gegenteil von", "anderes Wort für"
+
+
+def create_word_grid(w: int,
+                     h: int,
+                     lang_code: str = "en",
+                     target_density: float = 0.5,
+                     difficulty: int = 0,
+                     mode: str = "random",
+                     seed: int = None,
+                     stats: dict = None,
+                     deadline: float = None,
+                     max_iterations: int = 1200,
+                     stop_event=None):
+    # mode "random" draws a random word and searches a place for it,
+    # mode "pattern" chooses an open slot first and then a word matching the slot's letters.
+    # The same seed always generates the same crossword (unless the deadline cuts it short).
+    # deadline: time.time() timestamp, generation stops there and returns the grid reached so far.
+    # Without a deadline it stops after max_iterations.
+    # stop_event: e.g. a multiprocessing Event, generation stops early once it is set. Since
+    # it may be a proxy to another process, it is only checked every few iterations.
+    # If a stats dict is given, it is filled with the number of iterations, placed words,
+    # the reached density and the time spent per phase in seconds
+    assert mode in ("random", "pattern")
+
+    rng = random.Random(seed)
+
+    logging.info("generate new crossword with params: w:%s h:%s lang:%s density:%s difficulty:%s mode:%s",
                  str(w),
                  str(h),
                  lang_code,
                  str(target_density),
-                 str(difficulty))
+                 str(difficulty),
+                 mode)
 
-    t_num_translations = get_difficulty_threshold(lang = lang_code, difficulty = difficulty)
+    word_index = get_word_index(lang=lang_code)
+    if mode == "pattern":
+        pattern_index = get_pattern_index(lang=lang_code)
 
-    database = get_database(lang=lang_code)
-    list_words = list(database.keys())
-
-    grid = np.full(shape=(h, w), dtype=np.unicode, fill_value=' ')
+    grid = letter_grid.LetterGrid(h, w)
 
     locations = {}
 
     word_hints = {}
 
+    # word_draw: drawing words, including skipping used ones. crossover: finding where a word
+    # could cross the grid (open slots in mode "pattern"). fit_check: checking those places
+    # against the neighboring cells. density and solution_word: as named
+    timings = {
+        'word_draw': 0.0,
+        'crossover': 0.0,
+        'fit_check': 0.0,
+        'density': 0.0,
+        'solution_word': 0.0
+    }
+
     def store_location(char: str, y: int, x: int):
         assert len(char) == 1
 
@@ -161,175 +491,87 @@ def create_word_grid(w: int, h: int, lang_code: str = "en", target_density: floa
 
         locations[char].append([y, x])
 
-    remove_digits = str.maketrans('', '', digits)
-    n_words = len(list_words)
-
     def get_word(max_length: int, min_length=0):
         assert max_length > 1
 
-        index = random.randint(0, n_words-1)
-        word = list_words[index][:]
-
-        num_translations = database[word]['num_translations']
-        t = t_num_translations
-
-        while len(word) >= max_length or not word.isalnum() or len(word) <= min_length or num_translations < t:
-            index = random.randint(0, n_words-1)
-            word = list_words[index][:]
-            num_translations = database[word]['num_translations']
-
-        return word
+        return word_index.get_word(difficulty, max_length=max_length, min_length=min_length, rng=rng)
 
-    def normalize_word(word: str):
-        word = word.translate(remove_digits)
-        return word.lower()
-
-    opposite_prefix = "opposite of" if lang_code == "en" else "Gegenteil von"
-    synonym_prefix = "other word for" if lang_code == "en" else "anderes Wort für"
+    opposite_prefix, synonym_prefix = get_hint_prefixes(lang_code)
 
     def place_word(word: str, y: int, x: int, vertical: bool = False):
         normalized_word = normalize_word(word)
-        n = len(normalized_word)
-        if vertical:
-            assert grid.shape[0] - n >= y
-            for i, char in enumerate(normalized_word):
-                grid[y + i, x] = char
-                store_location(char, y+i, x)
-        else:
-            assert grid.shape[1] - n >= x
-            for i, char in enumerate(normalized_word):
-                grid[y, x + i] = char
-                store_location(char, y, x+i)
+        for char_y, char_x, char in grid.place(normalized_word, y, x, vertical):
+            store_location(char, char_y, char_x)
 
         word_hints[normalized_word] = WordInfo(
-            word, y, x, vertical, database, opposite_prefix, synonym_prefix)
+            word, y, x, vertical, lang_code, opposite_prefix, synonym_prefix, rng)
 
     def density():
-        return 1 - (grid == " ").sum() / (w * h)
-
-    def check_if_fits(word: str, y: int, x: int, vertical: bool):
-        n = len(word)
-        if vertical:
-
-            # check if there is space before and after
-            if y - 1 >= 0 and grid[y - 1, x] != " ":
-                return False
-            if y + n < grid.shape[0] and grid[y+n, x] != " ":
-                return False
-
-            if grid.shape[0] - n < y or y < 0:
-                # print("over board")
-                return False
-
-            for i, char in enumerate(word):
-                char_x = x
-                char_y = y + i
-
-                if not (grid[char_y, char_x] == " " or grid[char_y, char_x] == char):
-                    # print("not matching")
-                    return False
-
-                if grid[char_y, char_x] == " ":
-                    # check for horizonatal neighbors:
-                    if char_x - 1 >= 0 and grid[char_y, char_x - 1] != " ":
-                        # print("3")
-                        return False
-                    if char_x + 1 < grid.shape[1] and grid[char_y, char_x + 1] != " ":
-                        # print("4")
-                        return False
-
-        else:
-
-            # check if there is space before and after
-            if x - 1 >= 0 and grid[y, x - 1] != " ":
-                return False
-            if x + n < grid.shape[1] and grid[y, x + n] != " ":
-                return False
-
-            if grid.shape[1] - n < x or x < 0:
-                # print("over board")
-                return False
-
-            for i, char in enumerate(word):
-                char_x = x + i
-                char_y = y
-
-                if not (grid[char_y, char_x] == " " or grid[char_y, char_x] == char):
-                    # print("not matching")
-                    return False
-
-                if grid[char_y, char_x] == " ":
-                    # check for vertical neighbors:
-                    if char_y - 1 >= 0 and grid[char_y - 1, char_x] != " ":
-                        # print("1")
-                        return False
-                    if char_y + 1 < grid.shape[0] and grid[char_y + 1, char_x] != " ":
-                        # print("2")
-                        return False
-
-        return True
+        t = time.perf_counter()
+        result = grid.density()
+        timings['density'] += time.perf_counter() - t
+        return result
 
     def get_crossover(word: str):
         # returns Tuple of: (y,x, is_vertical?) or None
+        word_codes = grid.encode(word)
 
-        shuffled_order = list(range(len(word)))
-        random.shuffle(shuffled_order)
-
-        for index in shuffled_order:
-            # check for existing locations
-            char = word[index]
-            if char in locations:
-                char_locations = locations[char]
+        t = time.perf_counter()
+        starts = grid.find_crossings(word_codes)
+        timings['crossover'] += time.perf_counter() - t
 
-                for char_loc in char_locations:
-                    # test vertical
-                    y = char_loc[0] - index
-                    x = char_loc[1]
+        t = time.perf_counter()
+        ys, xs, verticals = grid.check_placements(word_codes, starts)
+        timings['fit_check'] += time.perf_counter() - t
 
-                    if check_if_fits(word, y, x, vertical=True):
-                        return (y, x, True)
+        n = len(ys)
+        if n == 0:
+            return None
 
-                    # test horizontal
-                    y = char_loc[0]
-                    x = char_loc[1] - index
+        i = rng.randint(0, n-1)
+        return (int(ys[i]), int(xs[i]), bool(verticals[i]))
 
-                    if check_if_fits(word, y, x, vertical=False):
-                        return (y, x, False)
-
-        return None
+    def get_slot_word(max_length: int, min_length=0, max_slots: int = 20):
+        # returns Tuple of: (word, y, x, is_vertical) or None
 
-    def get_solution_word(min_length=8, max_length=100):
-        word = get_word(min_length=min_length, max_length=max_length)
-
-        # search for matching characters in locations
-        locations_cpy = dict(locations)
-        solution_locations = []
-
-        for char in word:
-            if char not in locations_cpy or len(locations_cpy[char]) == 0:
-                # next try:
-                return get_solution_word(min_length=min_length, max_length=max_length)
-
-            location_candidates = locations_cpy[char]
-
-            n = len(location_candidates)
-
-            i = random.randint(0, n-1)
+        lengths = word_index.get_lengths(difficulty, max_length=max_length, min_length=min_length)
+        if len(lengths) == 0:
+            raise NoDataException
 
-            solution_locations.append(location_candidates[i])
-            del(location_candidates[i])
+        n = rng.choice(lengths)
+        t = time.perf_counter()
+        ys, xs, verticals = grid.find_slots(n)
+        timings['crossover'] += time.perf_counter() - t
+
+        # try some of the open slots in random order, until one has a matching word
+        slot_order = list(range(len(ys)))
+        rng.shuffle(slot_order)
+        for k in slot_order[:max_slots]:
+            y, x, is_vertical = int(ys[k]), int(xs[k]), bool(verticals[k])
+
+            t = time.perf_counter()
+            candidates = pattern_index.find_words(grid.get_pattern(y, x, n, is_vertical), difficulty)
+            rng.shuffle(candidates)
+            timings['word_draw'] += time.perf_counter() - t
+
+            t = time.perf_counter()
+            for word in candidates:
+                if normalize_word(word) not in word_hints:
+                    timings['word_draw'] += time.perf_counter() - t
+                    return (word, y, x, is_vertical)
+            timings['word_draw'] += time.perf_counter() - t
 
-        return solution_locations
+        return None
 
     min_shape = min(w, h, 30)
 
     # place first word:
     first_word = get_word(max_length=min_shape,
-                          min_length=min(10, grid.shape[1] - 2))
+                          min_length=min(10, min_shape - 2))
 
     # find random place:
-    x = random.randint(0, grid.shape[1] - len(first_word) - 1)
-    y = random.randint(0, grid.shape[0] - 1)
+    x = rng.randint(0, grid.shape[1] - len(normalize_word(first_word)) - 1)
+    y = rng.randint(0, grid.shape[0] - 1)
 
     place_word(first_word, y, x, vertical=False)
 
@@ -338,23 +580,57 @@ def create_word_grid(w: int, h: int, lang_code: str = "en", target_density: floa
     current_density = density()
 
     while current_density < target_density:
-        word = get_word(max_length=(1 - current_density ** 0.4) * min_shape,
-                        min_length=max(min(10, 0.5 * (1 - current_density ** 0.3) * min_shape), 2))
+        i += 1
+        if deadline is None:
+            if i > max_iterations:
+                break
+        elif time.time() >= deadline:
+            logging.info("crossword generation deadline reached")
+            break
+
+        if stop_event is not None and i % 32 == 0 and stop_event.is_set():
+            logging.info("crossword generation stopped")
+            break
+
+        max_length = (1 - current_density ** 0.4) * min_shape
+        min_length = max(min(10, 0.5 * (1 - current_density ** 0.3) * min_shape), 2)
+
+        if mode == "pattern":
+            # slots are only offered where words fit, so short words stay
+            # available even in dense grids
+            try:
+                slot_word = get_slot_word(max_length=max(max_length, 6), min_length=min_length)
+            except NoDataException:
+                # no words left for the current length window
+                break
+
+            if slot_word is not None:
+                word, y, x, is_vertical = slot_word
+                place_word(word, y, x, is_vertical)
+
+            current_density = density()
+            continue
 
+        t = time.perf_counter()
+        try:
+            word = get_word(max_length=max_length, min_length=min_length)
+        except NoDataException:
+            # no words left for the current length window
+            break
+        finally:
+            timings['word_draw'] += time.perf_counter() - t
+
+        t = time.perf_counter()
         normalized_word = normalize_word(word)
+        is_used = normalized_word in word_hints
+        timings['word_draw'] += time.perf_counter() - t
 
-        if normalized_word in word_hints:
+        if is_used:
             continue
 
         # check if matching characters exist:
         crossover = get_crossover(normalized_word)
 
-        i += 1
-        if i % 1000 == 0:
-            print(i)
-        if i > 1200:
-            break
-
         if crossover == None:
             current_density = density()
             continue
@@ -365,7 +641,15 @@ def create_word_grid(w: int, h: int, lang_code: str = "en", target_density: floa
 
         current_density = density()
 
-    solution_word_locations = get_solution_word()
+    t = time.perf_counter()
+    solution_word_locations = get_solution_word(word_index, difficulty, locations, rng=rng)
+    timings['solution_word'] += time.perf_counter() - t
+
+    if stats is not None:
+        stats['iterations'] = i
+        stats['words'] = len(word_hints)
+        stats['density'] = density()
+        stats['timings'] = timings
 
     logging.info("crossword generation done after %s iterations", str(i))
-    return grid, word_hints, solution_word_locations
+    return grid.to_chars(), word_hints, solution_word_locations
@@ -0,0 +1,153 @@
+import asyncio
+import concurrent.futures
+import concurrent.futures.process
+import logging
+import multiprocessing
+import threading
+import time
+
+from . import crossword
+
+
+def generate_serialized_crossword(width: int, height: int, lang_code: str = "en", difficulty: int = 0,
+                                  deadline: float = None, backend: str = "greedy") -> dict:
+    # runs inside a worker process. Returns the serialized crossword, which is
+    # all that is needed to rebuild it via crossword.Crossword(..., serialized=...)
+    return crossword.Crossword(width=width,
+                               height=height,
+                               lang_code=lang_code,
+                               difficulty=difficulty,
+                               deadline=deadline,
+                               backend=backend).serialize()
+
+
+class CrosswordWorker(object):
+    # runs the cpu bound crossword generation in a process pool, so the
+    # websocket event loop keeps serving other sessions meanwhile
+
+    def __init__(self, max_workers: int = None, max_concurrent: int = 2, time_budget: float = None, attempts: int = 1,
+                 backend: str = "greedy"):
+        # time_budget: seconds a single generation may take, measured from the start
+        # of the generation (not including the time waiting for a free slot)
+        # attempts: number of differently seeded generations per crossword, the best one is kept
+        # backend: "greedy" or "backtracking", see crossword.Grid
+        self._max_concurrent = max_concurrent
+        self._time_budget = time_budget
+        self._attempts = attempts
+        self._backend = backend
+        self._max_workers = max_workers
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        self._executor_lock = threading.Lock()
+        self._semaphore = None
+
+        # the manager provides events to stop running attempts in the worker processes,
+        # it is started on first use
+        self._manager = None
+        self._manager_lock = threading.Lock()
+
+    def shutdown(self):
+        self._executor.shutdown()
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    def _get_manager(self):
+        with self._manager_lock:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            return self._manager
+
+    def _restart_if_broken(self, executor: concurrent.futures.Executor):
+        # a worker process that died, e.g. killed for running out of memory, leaves the pool
+        # broken for good. submit raises right away on a broken pool, which is replaced then
+        try:
+            executor.submit(int)
+        except concurrent.futures.process.BrokenProcessPool:
+            with self._executor_lock:
+                if self._executor is executor:
+                    logging.error("crossword worker processes died, restarting them")
+                    executor.shutdown(wait=False)
+                    self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._max_workers)
+
+    def _generate_best_of(self, width: int, height: int, lang: str, difficulty: int) -> crossword.Crossword:
+        # blocks until the best attempt is chosen, the attempts themselves run in the process pool
+        executor = self._executor
+        new_crossword = crossword.Crossword(width=width,
+                                            height=height,
+                                            lang_code=lang,
+                                            difficulty=difficulty,
+                                            deadline=self._get_deadline(),
+                                            attempts=self._attempts,
+                                            executor=executor,
+                                            stop_event=self._get_manager().Event(),
+                                            backend=self._backend)
+        if not new_crossword.is_generated():
+            # failed attempts are only logged by the grid, the pool may be broken
+            self._restart_if_broken(executor)
+        return new_crossword
+
+    def _get_deadline(self):
+        if self._time_budget is None:
+            return None
+        return time.time() + self._time_budget
+
+    async def generate(self, width: int = 20, height: int = 20, lang: str = "en", difficulty: int = 0) -> crossword.Crossword:
+        # at most max_concurrent generations are awaited at once, a burst of
+        # new sessions queues up here instead of occupying every core
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrent)
+
+        async with self._semaphore:
+            loop = asyncio.get_event_loop()
+            if self._attempts > 1:
+                # choosing the best attempt waits for the pool, so it runs in a thread
+                return await loop.run_in_executor(None,
+                                                  self._generate_best_of,
+                                                  width,
+                                                  height,
+                                                  lang,
+                                                  difficulty)
+
+            executor = self._executor
+            try:
+                serialized = await loop.run_in_executor(executor,
+                                                        generate_serialized_crossword,
+                                                        width,
+                                                        height,
+                                                        lang,
+                                                        difficulty,
+                                                        self._get_deadline(),
+                                                        self._backend)
+            except Exception:
+                self._restart_if_broken(executor)
+                raise
+
+        logging.debug("received generated crossword from worker")
+        return crossword.Crossword(width=width,
+                                   height=height,
+                                   lang_code=lang,
+                                   difficulty=difficulty,
+                                   serialized=serialized)
+
+    def generate_sync(self, width: int = 20, height: int = 20, lang: str = "en", difficulty: int = 0) -> crossword.Crossword:
+        # blocking variant for callers outside the event loop, e.g. the puzzle pool thread
+        if self._attempts > 1:
+            return self._generate_best_of(width, height, lang, difficulty)
+
+        executor = self._executor
+        try:
+            serialized = executor.submit(generate_serialized_crossword,
+                                         width,
+                                         height,
+                                         lang,
+                                         difficulty,
+                                         self._get_deadline(),
+                                         self._backend).result()
+        except Exception:
+            self._restart_if_broken(executor)
+            raise
+
+        return crossword.Crossword(width=width,
+                                   height=height,
+                                   lang_code=lang,
+                                   difficulty=difficulty,
+                                   serialized=serialized)
@@ -2,17 +2,114 @@ import websockets
 import asyncio
 import json
 import logging
+from . import metrics
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 logging.basicConfig(level=logging.INFO)
 
+
+# message codecs, negotiated as websocket subprotocol when connecting. Clients not asking
+# for a subprotocol get json. Incoming text frames are always decoded as json
+
+class JsonCodec(object):
+    name = "json"
+    subprotocol = "crossword.json"
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(message)
+
+    def decode(self, data) -> dict:
+        return json.loads(data)
+
+
+class MsgpackCodec(object):
+    # binary frames, only offered if msgpack is installed
+    name = "msgpack"
+    subprotocol = "crossword.msgpack"
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data) -> dict:
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise ValueError(str(e))
+
+
+JSON_CODEC = JsonCodec()
+
+# in order of preference
+CODECS = ([MsgpackCodec()] if msgpack is not None else []) + [JSON_CODEC]
+
+
+def select_subprotocol(offered_subprotocols: list) -> str:
+    # the preferred codec's subprotocol among those offered by the client,
+    # None (json without subprotocol) if it offers none of them
+    for codec in CODECS:
+        if codec.subprotocol in offered_subprotocols:
+            return codec.subprotocol
+    return None
+
+
+def get_codec(subprotocol: str):
+    for codec in CODECS:
+        if codec.subprotocol == subprotocol:
+            return codec
+    return JSON_CODEC
+
+
+# websocket opcodes of text and binary frames
+_DATA_OPCODES = (1, 2)
+
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    # permessage-deflate, leaving messages below the threshold uncompressed. Compressing a
+    # keystroke update costs more than it saves, a whole crossword is worth it
+    def __init__(self, threshold: int, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._threshold = threshold
+
+    def encode(self, frame):
+        if frame.opcode in _DATA_OPCODES and frame.fin and len(frame.data) < self._threshold:
+            return frame
+        return super().encode(frame)
+
+
+class ThresholdDeflateFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, threshold: int, **kwargs):
+        super().__init__(**kwargs)
+        self._threshold = threshold
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, ThresholdPerMessageDeflate(self._threshold,
+                                                           extension.remote_no_context_takeover,
+                                                           extension.local_no_context_takeover,
+                                                           extension.remote_max_window_bits,
+                                                           extension.local_max_window_bits,
+                                                           extension.compress_settings)
+
 class JsonWebsocketConnection(object):
 
+    # outgoing messages waiting for a slow client, once exceeded the client is dropped
+    max_queue_size = 64
+
     def __init__(self,
                  websocket: websockets.WebSocketServerProtocol):
         
         logging.info("incoming connection")
         self._websocket = websocket
         self._is_closed = False;
+        self._codec = get_codec(getattr(websocket, "subprotocol", None))
+        # messages are written by a separate task, so sending never waits for the client
+        self._outgoing = asyncio.Queue(maxsize=JsonWebsocketConnection.max_queue_size)
+        self._writer = None
     
     def is_closed(self):
         return self._is_closed
@@ -27,22 +124,59 @@ class JsonWebsocketConnection(object):
         except Exception as e:
             logging.warning("error closing connection: %s", str(e))
     
+    def get_codec(self):
+        return self._codec
+
     async def send(self, message: dict):
-        string_message = json.dumps(message)
-        logging.debug("sending message: %s", string_message)
+        await self.send_encoded(self._codec.encode(message))
+
+    async def send_encoded(self, string_message):
+        # sends a message already encoded with this connection's codec, e.g. one cached for
+        # several sockets. Only queues the message, it is written by the writer task
+        if self._is_closed:
+            return
+
         try:
-            await self._websocket.send(string_message)
-        except Exception as e:
-            logging.warning("error sending message: %s", str(e))
+            self._outgoing.put_nowait(string_message)
+        except asyncio.QueueFull:
+            # the client does not keep up. It gets dropped and resyncs on reconnect
+            logging.warning("outgoing queue full, dropping connection")
+            metrics.DROPPED_CONNECTIONS.inc()
+            self._drop()
+            return
+
+        metrics.OUTGOING_QUEUE_DEPTH.observe(self._outgoing.qsize())
+
+    def get_queue_size(self) -> int:
+        return self._outgoing.qsize()
+
+    def _drop(self):
+        self._is_closed = True
+        asyncio.ensure_future(self._websocket.close())
+
+    async def _write_loop(self):
+        while True:
+            string_message = await self._outgoing.get()
+            logging.debug("sending message: %s", string_message)
+            try:
+                await self._websocket.send(string_message)
+            except Exception as e:
+                logging.warning("error sending message: %s", str(e))
+                self._is_closed = True
+                return
     
     async def handle_message(self, message: dict):
         pass # override this function
 
     async def run(self):
+        self._writer = asyncio.ensure_future(self._write_loop())
         try:
             async for message in self._websocket:
                 try:
-                    json_message = json.loads(message)
+                    if isinstance(message, str):
+                        json_message = JSON_CODEC.decode(message)
+                    else:
+                        json_message = self._codec.decode(message)
                     await self.handle_message(json_message) 
                 except ValueError as e:
                     logging.warning("received unprocessable message %s", str(e))
@@ -53,32 +187,60 @@ class JsonWebsocketConnection(object):
                 self._is_closed = True
         finally:
             self._is_closed = True
+            self._writer.cancel()
         
         
 
 
 
 class JsonWebsocketServer(object):
-    def __init__(self, handler_class: JsonWebsocketConnection, host:str = 'localhost', port:int = 8765, ssl_context = None):
+    def __init__(self, handler_class: JsonWebsocketConnection, host:str = 'localhost', port:int = 8765, ssl_context = None,
+                 deflate_window_bits: int = 12, deflate_mem_level: int = 5, compression_threshold: int = 256):
+        # deflate_window_bits and deflate_mem_level trade compression for memory per connection,
+        # messages shorter than compression_threshold bytes are sent uncompressed
         self._host = host
         self._port = port
         self._handler_class = handler_class
         self._ssl_context = ssl_context
+        self._deflate_window_bits = deflate_window_bits
+        self._deflate_mem_level = deflate_mem_level
+        self._compression_threshold = compression_threshold
 
     def run(self):
         async def main(websocket: websockets.WebSocketServerProtocol,
-                       path: str):
+                       path: str = None):
 
             connection = self._handler_class(websocket)
 
             await connection.run()
 
-        if (self._ssl_context is not None):
-            start_server = websockets.serve(main, self._host, self._port, ssl=self._ssl_context)
+        # the new server implementation of websockets (the default serve from version 14 on) rejects
+        # clients offering no subprotocol unless select_subprotocol allows it. Its signature
+        # differs from the one of the legacy server
+        if websockets.serve.__module__ == "websockets.asyncio.server":
+            def select(connection, offered_subprotocols):
+                return select_subprotocol(offered_subprotocols)
         else:
-            start_server = websockets.serve(main, self._host, self._port)
+            def select(offered_subprotocols, server_subprotocols):
+                return select_subprotocol(offered_subprotocols)
 
-        asyncio.get_event_loop().run_until_complete(start_server)
+        options = {
+            'subprotocols': [codec.subprotocol for codec in CODECS],
+            'select_subprotocol': select,
+            'compression': None,
+            'extensions': [ThresholdDeflateFactory(self._compression_threshold,
+                                                   server_max_window_bits=self._deflate_window_bits,
+                                                   client_max_window_bits=self._deflate_window_bits,
+                                                   compress_settings={'memLevel': self._deflate_mem_level})]
+        }
+
+        if (self._ssl_context is not None):
+            options['ssl'] = self._ssl_context
+
+        async def start_server():
+            # the new server implementation needs a running event loop when it is created
+            return await websockets.serve(main, self._host, self._port, **options)
+
+        asyncio.get_event_loop().run_until_complete(start_server())
         asyncio.get_event_loop().run_forever()
         
-
@@ -0,0 +1,323 @@
+import numpy as np
+
+
+class PlacementTables(object):
+    # lookup tables for horizontal placements on a (possibly transposed) grid
+
+    def __init__(self, codes: np.ndarray, occupied: np.ndarray):
+        h, w = codes.shape
+        self.codes = codes
+        self.occupied = occupied
+
+        # empty cells with a letter above or below must not be filled
+        side_blocked = np.zeros_like(occupied)
+        side_blocked[1:, :] |= occupied[:-1, :]
+        side_blocked[:-1, :] |= occupied[1:, :]
+        self.free = ~occupied & ~side_blocked
+
+        # space before and after a word
+        self.before_free = np.ones(shape=(h, w), dtype=bool)
+        self.before_free[:, 1:] = ~occupied[:, :-1]
+        self.after_free = np.ones(shape=(h, w + 1), dtype=bool)
+        self.after_free[:, :-1] = ~occupied
+
+        # prefix sums to count letters and pairs of neighboring letters inside a span
+        self.occupied_sums = np.zeros(shape=(h, w + 1), dtype=np.int32)
+        np.cumsum(occupied, axis=1, out=self.occupied_sums[:, 1:])
+        self.adjacent_sums = np.zeros(shape=(h, w), dtype=np.int32)
+        np.cumsum(occupied[:, :-1] & occupied[:, 1:], axis=1, out=self.adjacent_sums[:, 1:])
+        self.blocked_sums = np.zeros(shape=(h, w + 1), dtype=np.int32)
+        np.cumsum(~occupied & ~self.free, axis=1, out=self.blocked_sums[:, 1:])
+
+    def _span_mask(self, n: int) -> np.ndarray:
+        # returns a boolean mask of shape (h, w - n + 1) holding all start positions
+        # of horizontal spans of length n, regardless of the letters in it
+        h, w = self.codes.shape
+        m = w - n + 1
+
+        fits = self.before_free[:, :m] & self.after_free[:, n:]
+
+        # cross at least one existing letter, but also add at least one new one
+        n_crossed = self.occupied_sums[:, n:] - self.occupied_sums[:, :m]
+        fits &= (n_crossed > 0) & (n_crossed < n)
+
+        # two neighboring letters inside the span belong to an existing word in the
+        # same direction, the new word would "eat up" that one
+        fits &= self.adjacent_sums[:, n - 1:] == self.adjacent_sums[:, :m]
+
+        return fits
+
+    def find_slots(self, n: int) -> np.ndarray:
+        # like find, but for any word of length n. Empty cells of the slot
+        # only have to be free, the letters already in it form the pattern
+        h, w = self.codes.shape
+        if n > w:
+            return np.zeros(shape=(h, 0), dtype=bool)
+
+        m = w - n + 1
+        fits = self._span_mask(n)
+        fits &= self.blocked_sums[:, n:] == self.blocked_sums[:, :m]
+
+        return fits
+
+
+class Lanes(object):
+    # every grid row (horizontal lane) and every grid column (vertical lane) as one flat array,
+    # so placements in both orientations are checked in one batch. Lanes are separated by empty
+    # guard rows and columns, which makes bounds checks for neighboring cells unnecessary.
+    #
+    # layout: guard lane, h horizontal lanes, guard lane, w vertical lanes, guard lane.
+    # Each lane has a guard column in front, then its cells, then guard columns
+    def __init__(self, height: int, width: int):
+        self.height = height
+        self.width = width
+        self.stride = max(height, width) + 2
+
+        n_lanes = height + width + 3
+        self.codes = np.zeros(n_lanes * self.stride, dtype=np.uint16)
+        self.occupied = np.zeros(n_lanes * self.stride, dtype=bool)
+
+        # number of cells per lane, 0 for guard lanes
+        self.lane_lengths = np.zeros(n_lanes, dtype=np.int64)
+        self.lane_lengths[1:height + 1] = width
+        self.lane_lengths[height + 2:height + width + 2] = height
+
+    def horizontal_index(self, y: int, x: int) -> int:
+        return (1 + y) * self.stride + 1 + x
+
+    def vertical_index(self, y: int, x: int) -> int:
+        return (self.height + 2 + x) * self.stride + 1 + y
+
+    def set(self, y: int, x: int, code: int):
+        for i in (self.horizontal_index(y, x), self.vertical_index(y, x)):
+            self.codes[i] = code
+            self.occupied[i] = code != 0
+
+    def check(self, word_codes: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        # checks placements of a word at flat start indices, which have to be inside their lane
+        # and cross at least one existing letter (e.g. derived from anchors)
+        n = len(word_codes)
+        occupied = self.occupied
+
+        cells = starts[:, None] + np.arange(n)
+        span_occupied = occupied[cells]
+
+        # a letter differs from the existing one, or a new letter touches letters in the neighboring lanes
+        conflicts = np.where(span_occupied,
+                             self.codes[cells] != word_codes,
+                             occupied[cells - self.stride] | occupied[cells + self.stride])
+
+        # two neighboring letters inside the span belong to an existing word in the same direction,
+        # the new word would "eat up" that one. This also ensures at least one new letter is added
+        conflicts[:, 1:] |= span_occupied[:, :-1] & span_occupied[:, 1:]
+
+        fits = ~np.any(conflicts, axis=1)
+
+        # space before and after the word
+        fits &= ~(occupied[starts - 1] | occupied[starts + n])
+
+        return fits
+
+    def to_positions(self, starts: np.ndarray):
+        # flat start indices -> (ys, xs, verticals)
+        lanes = starts // self.stride
+        cols = starts % self.stride - 1
+
+        verticals = lanes > self.height + 1
+        ys = np.where(verticals, cols, lanes - 1)
+        xs = np.where(verticals, lanes - self.height - 2, cols)
+        return ys, xs, verticals
+
+
+# integer coded letter grid used during generation. Every letter gets a small
+# integer code (0 is reserved for empty cells), so placement checks run as batched
+# numpy operations instead of testing one anchor after another
+class LetterGrid(object):
+    def __init__(self, height: int, width: int):
+        self._codes = np.zeros(shape=(height, width), dtype=np.uint16)
+        self._occupied = np.zeros(shape=(height, width), dtype=bool)
+        self._lanes = Lanes(height, width)
+
+        self._alphabet = {}
+        self._letters = [' ']
+
+        self._n_occupied = 0
+
+        # open anchors: letters a new word can still cross. A letter is open horizontally if
+        # both its left and right neighbors are empty, vertically likewise. Letter code -> set
+        # of flat lane indices (see Lanes), updated incrementally on place and remove
+        self._anchors = {}
+        self._anchor_arrays = {}
+
+        # per orientation lookup tables derived from the current grid state,
+        # rebuilt lazily after each placement
+        self._tables = None
+
+    @property
+    def shape(self):
+        return self._codes.shape
+
+    def encode(self, word: str) -> np.ndarray:
+        codes = np.empty(len(word), dtype=np.uint16)
+        for i, char in enumerate(word):
+            if char not in self._alphabet:
+                self._alphabet[char] = len(self._letters)
+                self._letters.append(char)
+            codes[i] = self._alphabet[char]
+        return codes
+
+    def density(self) -> float:
+        return self._n_occupied / self._codes.size
+
+    def place(self, word: str, y: int, x: int, vertical: bool = False) -> list:
+        # returns the cells that were empty before as list of (y, x, char)
+        n = len(word)
+        if vertical:
+            assert self._codes.shape[0] - n >= y
+        else:
+            assert self._codes.shape[1] - n >= x
+
+        codes = self.encode(word)
+        new_cells = []
+        for i, char in enumerate(word):
+            cy = y + i if vertical else y
+            cx = x if vertical else x + i
+            if not self._occupied[cy, cx]:
+                self._codes[cy, cx] = codes[i]
+                self._occupied[cy, cx] = True
+                self._lanes.set(cy, cx, int(codes[i]))
+                new_cells.append((cy, cx, char))
+
+        self._n_occupied += len(new_cells)
+        self._tables = None
+        self._update_anchors(new_cells)
+
+        return new_cells
+
+    def remove(self, cells: list):
+        # undo a placement, cells as returned by place
+        for y, x, _ in cells:
+            self._remove_anchor(y, x)
+            self._codes[y, x] = 0
+            self._occupied[y, x] = False
+            self._lanes.set(y, x, 0)
+
+        self._n_occupied -= len(cells)
+        self._tables = None
+        self._update_anchors(cells)
+
+    def _set_anchor(self, code: int, i: int, is_open: bool):
+        anchors = self._anchors.setdefault(code, set())
+        if is_open == (i in anchors):
+            return
+        if is_open:
+            anchors.add(i)
+        else:
+            anchors.remove(i)
+        self._anchor_arrays.pop(code, None)
+
+    def _remove_anchor(self, y: int, x: int):
+        code = int(self._codes[y, x])
+        self._set_anchor(code, self._lanes.horizontal_index(y, x), False)
+        self._set_anchor(code, self._lanes.vertical_index(y, x), False)
+
+    def _update_anchors(self, cells: list):
+        # the changed cells and their neighbors may have opened or closed
+        h, w = self._codes.shape
+        occupied = self._occupied
+        for y, x, _ in cells:
+            for ny, nx in ((y, x), (y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)):
+                if ny < 0 or nx < 0 or ny >= h or nx >= w or not occupied[ny, nx]:
+                    continue
+                code = int(self._codes[ny, nx])
+                self._set_anchor(code, self._lanes.horizontal_index(ny, nx),
+                                 (nx == 0 or not occupied[ny, nx - 1]) and (nx == w - 1 or not occupied[ny, nx + 1]))
+                self._set_anchor(code, self._lanes.vertical_index(ny, nx),
+                                 (ny == 0 or not occupied[ny - 1, nx]) and (ny == h - 1 or not occupied[ny + 1, nx]))
+
+    def _get_anchor_array(self, code: int) -> np.ndarray:
+        if code not in self._anchor_arrays:
+            self._anchor_arrays[code] = np.fromiter(self._anchors.get(code, ()), dtype=np.int64)
+        return self._anchor_arrays[code]
+
+    def _get_tables(self):
+        if self._tables is None:
+            self._tables = (
+                PlacementTables(self._codes, self._occupied),
+                PlacementTables(np.ascontiguousarray(self._codes.T),
+                                np.ascontiguousarray(self._occupied.T))
+            )
+        return self._tables
+
+    @staticmethod
+    def _to_positions(horizontal: np.ndarray, vertical: np.ndarray):
+        # vertical masks are computed on the transposed grid
+        hy, hx = np.nonzero(horizontal)
+        vx, vy = np.nonzero(vertical)
+
+        ys = np.concatenate([hy, vy])
+        xs = np.concatenate([hx, vx])
+        verticals = np.concatenate([np.zeros(len(hy), dtype=bool), np.ones(len(vy), dtype=bool)])
+
+        return ys, xs, verticals
+
+    def find_placements(self, word: str):
+        # returns all legal placements crossing at least one existing letter
+        # as arrays (ys, xs, verticals). Only start positions derived from open
+        # anchors matching one of the word's letters are checked
+        word_codes = self.encode(word)
+        return self.check_placements(word_codes, self.find_crossings(word_codes))
+
+    def find_crossings(self, word_codes: np.ndarray) -> np.ndarray:
+        # first half of find_placements: the lane start positions at which the word
+        # would cross an open anchor, not checked for fit yet
+        candidates = []
+        for i, code in enumerate(word_codes):
+            # the anchor becomes the word's i-th letter
+            anchors = self._get_anchor_array(int(code))
+            if len(anchors) > 0:
+                candidates.append(anchors - i)
+
+        if len(candidates) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        return np.concatenate(candidates)
+
+    def check_placements(self, word_codes: np.ndarray, starts: np.ndarray):
+        # second half of find_placements: keeps the start positions from find_crossings
+        # at which the word fits, as arrays (ys, xs, verticals)
+        n = len(word_codes)
+        if len(starts) == 0:
+            return self._lanes.to_positions(starts)
+
+        # the word has to fit into the anchor's lane
+        lanes = self._lanes
+        cols = starts % lanes.stride
+        starts = starts[(cols >= 1) & (cols - 1 + n <= lanes.lane_lengths[starts // lanes.stride])]
+
+        # a word crossing several anchors is found once per anchor
+        starts = starts[lanes.check(word_codes, starts)]
+        if len(starts) > 1:
+            starts = np.unique(starts)
+
+        return lanes.to_positions(starts)
+
+    def find_slots(self, n: int):
+        # returns all open slots of length n crossing at least one existing letter
+        # as arrays (ys, xs, verticals)
+        horizontal_tables, vertical_tables = self._get_tables()
+
+        return self._to_positions(horizontal_tables.find_slots(n),
+                                  vertical_tables.find_slots(n))
+
+    def get_pattern(self, y: int, x: int, n: int, vertical: bool = False, placeholder: str = '?') -> str:
+        # returns the letters of a slot, e.g. "??a?e"
+        if vertical:
+            codes = self._codes[y:y + n, x]
+        else:
+            codes = self._codes[y, x:x + n]
+        return ''.join(self._letters[code] if code != 0 else placeholder for code in codes)
+
+    def to_chars(self) -> np.ndarray:
+        letters = np.array(self._letters, dtype='<U1')
+        return letters[self._codes]
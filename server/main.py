@@ -1,7 +1,13 @@
+import os
 import ssl
+import asyncio
 import logging
 from . import json_websockets
+from . import metrics
 from . import crossword_connection
+from . import crossword_worker
+from . import puzzle_pool
+from . import puzzle_archive
 
 try:
     cert_file = "./server/fullchain.pem"
@@ -14,8 +20,62 @@ except Exception as e:
     ssl_context = None
 
 
+# crossword generation runs in a process pool, outside of the websocket event loop
+generator_processes = os.environ.get("CROSSWORD_GENERATOR_PROCESSES")
+max_concurrent_generations = int(os.environ.get("CROSSWORD_MAX_CONCURRENT_GENERATIONS", "2"))
+# seconds a single generation may take before the best grid so far is used
+generation_time_budget = os.environ.get("CROSSWORD_GENERATION_TIME_BUDGET")
+# independent generations per crossword, the best one is kept
+generation_attempts = int(os.environ.get("CROSSWORD_GENERATION_ATTEMPTS", "1"))
+# "greedy" or "backtracking", see crossword.Grid
+generator_backend = os.environ.get("CROSSWORD_GENERATOR_BACKEND", "greedy")
+crossword_connection.CrosswordConnection.generator_backend = generator_backend
+
+crossword_connection.CrosswordConnection.crossword_worker = crossword_worker.CrosswordWorker(
+    max_workers=int(generator_processes) if generator_processes else None,
+    max_concurrent=max_concurrent_generations,
+    time_budget=float(generation_time_budget) if generation_time_budget else None,
+    attempts=generation_attempts,
+    backend=generator_backend
+)
+
+# warm inventory of pre-generated puzzles, set CROSSWORD_POOL_CAPACITY=0 to disable it
+pool_capacity = int(os.environ.get("CROSSWORD_POOL_CAPACITY", "4"))
+pool_low_water_mark = int(os.environ.get("CROSSWORD_POOL_LOW_WATER_MARK", str(pool_capacity // 2)))
+
+if pool_capacity > 0:
+    crossword_connection.CrosswordConnection.puzzle_pool = puzzle_pool.PuzzlePool(
+        capacity=pool_capacity,
+        low_water_mark=pool_low_water_mark,
+        crossword_worker=crossword_connection.CrosswordConnection.crossword_worker,
+        backend=generator_backend
+    )
+    crossword_connection.CrosswordConnection.puzzle_pool.start()
+
+# pre-built puzzles, see build_puzzles.py
+archive_file = os.environ.get("CROSSWORD_PUZZLE_ARCHIVE", "./server/puzzles.cwa")
+if os.path.exists(archive_file):
+    crossword_connection.CrosswordConnection.puzzle_archive = puzzle_archive.PuzzleArchive(archive_file)
+    logging.info("puzzle archive loaded: %s", str(crossword_connection.CrosswordConnection.puzzle_archive.get_counts()))
+
+
+# milliseconds to collect updates of a session before sending them as one message
+crossword_connection.CrosswordConnection.flush_interval = float(os.environ.get("CROSSWORD_UPDATE_FLUSH_MS", "0")) / 1000
+
+# messages queued for a slow client before it is dropped
+json_websockets.JsonWebsocketConnection.max_queue_size = int(os.environ.get("CROSSWORD_MAX_OUTGOING_QUEUE", "64"))
+
+# prometheus metrics at http://localhost:<port>/metrics, set CROSSWORD_METRICS_PORT=0 to disable them
+metrics_port = int(os.environ.get("CROSSWORD_METRICS_PORT", "9180"))
+if metrics_port > 0:
+    asyncio.get_event_loop().run_until_complete(metrics.start_http_server(port=metrics_port))
+
+# permessage-deflate settings, smaller windows and memory levels need less memory per connection
 server = json_websockets.JsonWebsocketServer(
-    crossword_connection.CrosswordConnection, ssl_context=ssl_context
+    crossword_connection.CrosswordConnection, ssl_context=ssl_context,
+    deflate_window_bits=int(os.environ.get("CROSSWORD_DEFLATE_WINDOW_BITS", "12")),
+    deflate_mem_level=int(os.environ.get("CROSSWORD_DEFLATE_MEM_LEVEL", "5")),
+    compression_threshold=int(os.environ.get("CROSSWORD_COMPRESSION_THRESHOLD", "256"))
 )
 
 
@@ -0,0 +1,155 @@
+import asyncio
+import bisect
+import logging
+
+# in-process metrics, served in the Prometheus text format by start_http_server on the
+# event loop of the websocket server.
+#
+# usage:
+#   metrics.MESSAGES.inc("register")
+#   metrics.HANDLE_MESSAGE_SECONDS.observe(0.002, "register")
+#   curl localhost:9180/metrics
+
+_registry = []
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = None) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f"{name}=\"{value}\"")
+    if extra is not None:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter(object):
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self._name = name
+        self._help_text = help_text
+        self._labels = labels
+        # label values -> count
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self._name} {self._help_text}", f"# TYPE {self._name} counter"]
+        for label_values, value in self._values.items():
+            lines.append(f"{self._name}{_format_labels(self._labels, label_values)} {value}")
+        return lines
+
+
+class Gauge(object):
+    def __init__(self, name: str, help_text: str):
+        # the value is read from a function when collected, e.g. the number of sessions
+        self._name = name
+        self._help_text = help_text
+        self._function = None
+        _registry.append(self)
+
+    def set_function(self, function):
+        self._function = function
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self._name} {self._help_text}", f"# TYPE {self._name} gauge"]
+        if self._function is not None:
+            lines.append(f"{self._name} {self._function()}")
+        return lines
+
+
+class Histogram(object):
+    def __init__(self, name: str, help_text: str, buckets: tuple, labels: tuple = ()):
+        self._name = name
+        self._help_text = help_text
+        self._buckets = tuple(sorted(buckets))
+        self._labels = labels
+        # label values -> [count per bucket and one for +Inf, sum]
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *label_values):
+        state = self._values.get(label_values)
+        if state is None:
+            state = [[0] * (len(self._buckets) + 1), 0.0]
+            self._values[label_values] = state
+
+        state[0][bisect.bisect_left(self._buckets, value)] += 1
+        state[1] += value
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self._name} {self._help_text}", f"# TYPE {self._name} histogram"]
+        for label_values, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self._buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _format_labels(self._labels, label_values, f"le=\"{bound}\"")
+                lines.append(f"{self._name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self._labels, label_values)
+            lines.append(f"{self._name}_sum{labels} {total}")
+            lines.append(f"{self._name}_count{labels} {cumulative}")
+        return lines
+
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+MESSAGES = Counter("crossword_messages_total", "incoming messages per type", labels=("type",))
+HANDLE_MESSAGE_SECONDS = Histogram("crossword_handle_message_seconds", "time to handle an incoming message",
+                                   _LATENCY_BUCKETS, labels=("type",))
+BROADCAST_SOCKETS = Histogram("crossword_broadcast_sockets", "sockets an update is sent to",
+                              (1, 2, 4, 8, 16, 32, 64, 128))
+BROADCAST_SECONDS = Histogram("crossword_broadcast_seconds", "time to hand an update to all sockets of a session",
+                              _LATENCY_BUCKETS)
+GENERATION_SECONDS = Histogram("crossword_generation_seconds", "time to get a new crossword for a session",
+                               (0.01, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0), labels=("source",))
+OUTGOING_QUEUE_DEPTH = Histogram("crossword_outgoing_queue_depth", "queued messages of a socket after sending",
+                                 (1, 2, 4, 8, 16, 32, 64))
+POOL_REQUESTS = Counter("crossword_pool_requests_total", "puzzle pool requests by result (hit or miss)",
+                        labels=("result",))
+DROPPED_CONNECTIONS = Counter("crossword_dropped_connections_total", "sockets dropped for a full outgoing queue")
+ACTIVE_SESSIONS = Gauge("crossword_active_sessions", "sessions in memory")
+ACTIVE_SOCKETS = Gauge("crossword_active_sockets", "open sockets registered to a session")
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines += metric.collect()
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        # skip the headers
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status = "200 OK"
+            body = render().encode("utf-8")
+        else:
+            status = "404 Not Found"
+            body = b"not found\n"
+
+        writer.write(f"HTTP/1.1 {status}\r\n"
+                     "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     "Connection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+    except Exception as e:
+        logging.warning("error serving metrics: %s", str(e))
+    finally:
+        writer.close()
+
+
+async def start_http_server(host: str = "localhost", port: int = 9180):
+    # serves render() at /metrics on the running event loop
+    server = await asyncio.start_server(_handle_request, host, port)
+    logging.info("metrics served at http://%s:%s/metrics", host, str(port))
+    return server
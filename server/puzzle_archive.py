@@ -0,0 +1,170 @@
+import os
+import random
+import struct
+import logging
+import threading
+import numpy as np
+
+from . import crossword
+from . import crossword_generator
+
+# append-only archive of pre-built crosswords, written by build_puzzles.py.
+#
+# layout:
+#   file header:   magic, version
+#   records:       record header (lang, difficulty, width, height, payload size), payload
+#
+# payload (little endian):
+#   f32 density, u8 grid height, u8 grid width, u16 letters size, utf-8 grid letters (' ' for empty cells)
+#   u16 number of words, per word: u8 y, u8 x, u8 is_vertical, u8 size, utf-8 word
+#   u16 solution length, per letter: u8 y, u8 x
+#
+# The index (record offsets per lang, difficulty and size) is built by reading only the
+# record headers, a puzzle is loaded with a single random access read of its payload.
+# Width and height are the crossword's size including the additional hint row and column.
+
+MAGIC = b"CWPA"
+VERSION = 1
+
+_FILE_HEADER = struct.Struct("<4sI")
+_RECORD_HEADER = struct.Struct("<2sBHHI")
+_GRID_HEADER = struct.Struct("<fBBH")
+_WORD_HEADER = struct.Struct("<BBBB")
+_COUNT = struct.Struct("<H")
+_LOCATION = struct.Struct("<BB")
+
+
+def encode_puzzle(raw_grid: np.ndarray, word_infos: dict, solution_locations: list, density: float) -> bytes:
+    h, w = raw_grid.shape
+    letters = "".join(raw_grid.flatten()).encode("utf-8")
+    parts = [_GRID_HEADER.pack(density, h, w, len(letters)), letters, _COUNT.pack(len(word_infos))]
+
+    for info in word_infos.values():
+        y, x = info.get_location()
+        word = info.get_word().encode("utf-8")
+        parts.append(_WORD_HEADER.pack(y, x, info.is_vertical(), len(word)))
+        parts.append(word)
+
+    parts.append(_COUNT.pack(len(solution_locations)))
+    for y, x in solution_locations:
+        parts.append(_LOCATION.pack(y, x))
+
+    return b"".join(parts)
+
+
+def decode_puzzle(payload: bytes, lang_code: str):
+    # returns (raw_grid, word_infos, solution_locations, density) as create_word_grid
+    # does, hints are chosen anew when the crossword is built
+    density, h, w, letters_size = _GRID_HEADER.unpack_from(payload, 0)
+    offset = _GRID_HEADER.size
+
+    letters = payload[offset:offset + letters_size].decode("utf-8")
+    offset += letters_size
+    raw_grid = np.array(list(letters), dtype='<U1').reshape(h, w)
+
+    opposite_prefix, synonym_prefix = crossword_generator.get_hint_prefixes(lang_code)
+
+    word_infos = {}
+    n_words, = _COUNT.unpack_from(payload, offset)
+    offset += _COUNT.size
+    for _ in range(n_words):
+        y, x, is_vertical, size = _WORD_HEADER.unpack_from(payload, offset)
+        offset += _WORD_HEADER.size
+        word = payload[offset:offset + size].decode("utf-8")
+        offset += size
+        word_infos[crossword_generator.normalize_word(word)] = crossword_generator.WordInfo(
+            word, y, x, bool(is_vertical), lang_code, opposite_prefix, synonym_prefix)
+
+    solution_locations = []
+    n_solution, = _COUNT.unpack_from(payload, offset)
+    offset += _COUNT.size
+    for _ in range(n_solution):
+        y, x = _LOCATION.unpack_from(payload, offset)
+        offset += _LOCATION.size
+        solution_locations.append([y, x])
+
+    return raw_grid, word_infos, solution_locations, density
+
+
+class PuzzleArchive(object):
+    def __init__(self, archive_file: str, writable: bool = False):
+        self._archive_file = archive_file
+        self._lock = threading.Lock()
+
+        if writable and not os.path.exists(archive_file):
+            with open(archive_file, "wb") as f:
+                f.write(_FILE_HEADER.pack(MAGIC, VERSION))
+
+        self._fd = os.open(archive_file, (os.O_RDWR | os.O_APPEND) if writable else os.O_RDONLY)
+
+        magic, version = _FILE_HEADER.unpack(os.pread(self._fd, _FILE_HEADER.size, 0))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported puzzle archive: {archive_file}")
+
+        # (lang, difficulty, width, height) -> list of (payload offset, payload size)
+        self._index = {}
+        self._indexed_size = _FILE_HEADER.size
+        self.refresh()
+
+    def close(self):
+        os.close(self._fd)
+
+    def refresh(self):
+        # indexes records appended since the last call, e.g. by a running batch build.
+        # An incomplete record at the end is left for the next call
+        with self._lock:
+            size = os.fstat(self._fd).st_size
+            offset = self._indexed_size
+            while offset + _RECORD_HEADER.size <= size:
+                lang, difficulty, width, height, payload_size = _RECORD_HEADER.unpack(
+                    os.pread(self._fd, _RECORD_HEADER.size, offset))
+                payload_offset = offset + _RECORD_HEADER.size
+                if payload_offset + payload_size > size:
+                    break
+
+                key = (lang.decode("ascii"), difficulty, width, height)
+                if key not in self._index:
+                    self._index[key] = []
+                self._index[key].append((payload_offset, payload_size))
+
+                offset = payload_offset + payload_size
+
+            self._indexed_size = offset
+
+    def append(self, lang: str, difficulty: int, width: int, height: int, payload: bytes):
+        record = _RECORD_HEADER.pack(lang.encode("ascii"), difficulty, width, height, len(payload)) + payload
+        with self._lock:
+            # O_APPEND, so concurrent writers never interleave inside a record
+            os.write(self._fd, record)
+
+    def count(self, lang: str = "en", difficulty: int = 0, width: int = 20, height: int = 20) -> int:
+        return len(self._index.get((lang, difficulty, width, height), []))
+
+    def get_counts(self) -> dict:
+        return {key: len(records) for key, records in self._index.items()}
+
+    def get_random_crossword(self, lang: str = "en", difficulty: int = 0, width: int = 20, height: int = 20) -> crossword.Crossword:
+        # returns a random archived crossword or None
+        if os.fstat(self._fd).st_size > self._indexed_size:
+            self.refresh()
+
+        records = self._index.get((lang, difficulty, width, height))
+        if not records:
+            return None
+
+        offset, size = random.choice(records)
+        payload = os.pread(self._fd, size, offset)
+
+        logging.debug("loading archived crossword at %s", str(offset))
+
+        try:
+            return crossword.Crossword(width=width,
+                                       height=height,
+                                       lang_code=lang,
+                                       difficulty=difficulty,
+                                       generated=decode_puzzle(payload, lang))
+        except Exception as e:
+            # e.g. an archived word missing from a rebuilt word database, the caller
+            # falls back to the pool or a new generation
+            logging.error("error loading archived crossword at %s: %s", str(offset), str(e))
+            return None
@@ -0,0 +1,136 @@
+import collections
+import itertools
+import logging
+import threading
+
+from . import metrics
+from . import crossword
+from . import crossword_worker
+
+
+class PuzzlePool(object):
+    # keeps a warm inventory of ready made crosswords for each configured
+    # (lang, difficulty, width, height). A background thread refills an inventory
+    # up to `capacity` as soon as it drops below `low_water_mark`. If a crossword
+    # worker is given, the generation itself runs in its process pool, otherwise
+    # crosswords are generated in the pool thread with the given backend.
+
+    def __init__(self,
+                 langs: tuple = ("en", "de"),
+                 difficulties: tuple = (0, 1, 2),
+                 sizes: tuple = ((20, 20),),
+                 capacity: int = 4,
+                 low_water_mark: int = 2,
+                 retry_delay: float = 10,
+                 crossword_worker: crossword_worker.CrosswordWorker = None,
+                 backend: str = "greedy"):
+        assert 0 <= low_water_mark <= capacity
+
+        self._capacity = capacity
+        self._low_water_mark = low_water_mark
+        self._retry_delay = retry_delay
+        self._crossword_worker = crossword_worker
+        self._backend = backend
+
+        self._inventories = {}
+        self._hits = {}
+        self._misses = {}
+        for lang, difficulty, (width, height) in itertools.product(langs, difficulties, sizes):
+            key = (lang, difficulty, width, height)
+            self._inventories[key] = collections.deque()
+            self._hits[key] = 0
+            self._misses[key] = 0
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def start(self):
+        if self._worker is not None:
+            return
+        self._worker = threading.Thread(target=self._run, name="puzzle_pool", daemon=True)
+        self._worker.start()
+
+    def get(self, lang: str = "en", difficulty: int = 0, width: int = 20, height: int = 20) -> crossword.Crossword:
+        # returns a ready made crossword or None
+        key = (lang, difficulty, width, height)
+
+        inventory = self._inventories.get(key)
+        new_crossword = None
+        if inventory is not None:
+            try:
+                new_crossword = inventory.popleft()
+            except IndexError:
+                pass
+
+        with self._lock:
+            if new_crossword is None:
+                if key in self._misses:
+                    self._misses[key] += 1
+            else:
+                self._hits[key] += 1
+
+        metrics.POOL_REQUESTS.inc("miss" if new_crossword is None else "hit")
+
+        if inventory is not None and len(inventory) < self._low_water_mark:
+            self._wakeup.set()
+
+        return new_crossword
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                key: {
+                    'size': len(inventory),
+                    'hits': self._hits[key],
+                    'misses': self._misses[key]
+                } for key, inventory in self._inventories.items()
+            }
+
+    def _get_keys_to_refill(self) -> list:
+        return [key for key, inventory in self._inventories.items() if len(inventory) < self._low_water_mark]
+
+    def _generate(self, lang: str, difficulty: int, width: int, height: int) -> crossword.Crossword:
+        if self._crossword_worker is not None:
+            return self._crossword_worker.generate_sync(width=width,
+                                                        height=height,
+                                                        lang=lang,
+                                                        difficulty=difficulty)
+
+        return crossword.Crossword(width=width,
+                                   height=height,
+                                   lang_code=lang,
+                                   difficulty=difficulty,
+                                   backend=self._backend)
+
+    def _run(self):
+        while True:
+            keys = self._get_keys_to_refill()
+            if len(keys) == 0:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            # refill round robin, so one drained inventory does not wait for all others
+            failed = False
+            while len(keys) > 0 and not failed:
+                for key in keys:
+                    try:
+                        new_crossword = self._generate(*key)
+                    except Exception as e:
+                        logging.error("error refilling puzzle pool %s: %s", str(key), str(e))
+                        failed = True
+                        break
+                    if not new_crossword.is_generated():
+                        logging.error("error refilling puzzle pool %s: generation failed", str(key))
+                        failed = True
+                        break
+                    self._inventories[key].append(new_crossword)
+                keys = [key for key in keys if len(self._inventories[key]) < self._capacity]
+
+            logging.debug("puzzle pool refilled: %s", str(self.get_stats()))
+
+            if failed:
+                # do not spin on a persistent error
+                self._wakeup.wait(timeout=self._retry_delay)
+                self._wakeup.clear()
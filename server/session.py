@@ -1,16 +1,51 @@
+import asyncio
+import collections
+import logging
+import time
 import datetime as dt
 from . import json_websockets
+from . import metrics
 from . import crossword
+from . import crossword_worker
+from . import puzzle_pool
+from . import puzzle_archive
 
 
 class Session(object):
-    def __init__(self, days_to_expire: int = 2) -> None:
+    def __init__(self,
+                 days_to_expire: int = 2,
+                 puzzle_pool: puzzle_pool.PuzzlePool = None,
+                 crossword_worker: crossword_worker.CrosswordWorker = None,
+                 puzzle_archive: puzzle_archive.PuzzleArchive = None,
+                 update_log_size: int = 256,
+                 flush_interval: float = 0.0,
+                 backend: str = "greedy") -> None:
         self.crossword = None
+        # (crossword, (wire format, codec) -> encoded crossword message), the layout never changes after generation
+        self._crossword_frames = None
+        self.puzzle_pool = puzzle_pool
+        self.crossword_worker = crossword_worker
+        self.puzzle_archive = puzzle_archive
+        # generator backend for crosswords generated inline, see crossword.Grid
+        self.backend = backend
+        self._crossword_lock = None
         self.datetime_created = dt.datetime.utcnow()
         self.connected_sockets = set()
         self.last_touched = self.datetime_created
         self.days_to_expire = 2
 
+        # every applied update increments the version. The last update_log_size updates
+        # are kept, so a reconnecting socket only needs the ones it missed
+        self.version = 0
+        self._update_log = collections.deque(maxlen=update_log_size)
+
+        # with a flush interval > 0, updates are collected per cell and sent at once
+        self.flush_interval = flush_interval
+        self._pending_updates = {}
+        self._flush_scheduled = False
+        # the scheduled flush, kept here since the event loop only holds a weak reference to it
+        self.flush_task = None
+
     def cleanup(self):
         sockets_to_remove = []
         for socket in self.connected_sockets:
@@ -38,18 +73,173 @@ class Session(object):
     def get_datetime_created(self) -> dt.datetime:
         return self.datetime_created
 
+    def _get_pooled_crossword(self, width: int, height: int, lang: str, difficulty: int) -> tuple:
+        # pre-built crosswords: a random archived one first, then one from the warm pool.
+        # Returns (crossword, source) with source "archive" or "pool", or (None, None)
+        if self.puzzle_archive is not None:
+            archived_crossword = self.puzzle_archive.get_random_crossword(lang=lang,
+                                                                          difficulty=difficulty,
+                                                                          width=width,
+                                                                          height=height)
+            if archived_crossword is not None:
+                return archived_crossword, "archive"
+
+        if self.puzzle_pool is None:
+            return None, None
+        pooled_crossword = self.puzzle_pool.get(lang=lang,
+                                                difficulty=difficulty,
+                                                width=width,
+                                                height=height)
+        if pooled_crossword is None:
+            return None, None
+        return pooled_crossword, "pool"
+
     def create_crossword(self, width: int = 20, height: int = 20, lang: str = "en", difficulty: int = 0):
-        self.crossword = crossword.Crossword(width=width,
-                                             height=height,
-                                             lang_code=lang,
-                                             difficulty=difficulty)
+        t_start = time.perf_counter()
+        new_crossword, source = self._get_pooled_crossword(width, height, lang, difficulty)
+
+        if new_crossword is None:
+            source = "inline"
+            new_crossword = crossword.Crossword(width=width,
+                                                height=height,
+                                                lang_code=lang,
+                                                difficulty=difficulty,
+                                                backend=self.backend)
+
+        metrics.GENERATION_SECONDS.observe(time.perf_counter() - t_start, source)
+        if not new_crossword.is_generated():
+            # not kept, so the next request tries again
+            logging.error("crossword generation failed: %s", str((lang, difficulty, width, height)))
+            return
+        self._set_crossword(new_crossword)
+
+    async def create_crossword_async(self, width: int = 20, height: int = 20, lang: str = "en", difficulty: int = 0):
+        # like create_crossword, but generates in the worker processes if available
+        t_start = time.perf_counter()
+        new_crossword, source = self._get_pooled_crossword(width, height, lang, difficulty)
+
+        if new_crossword is None and self.crossword_worker is not None:
+            source = "worker"
+            try:
+                new_crossword = await self.crossword_worker.generate(width=width,
+                                                                     height=height,
+                                                                     lang=lang,
+                                                                     difficulty=difficulty)
+            except Exception as e:
+                # e.g. a killed worker process, generated inline instead
+                logging.error("error generating crossword in worker: %s", str(e))
+            if new_crossword is not None and not new_crossword.is_generated():
+                new_crossword = None
+
+        if new_crossword is None:
+            source = "inline"
+            new_crossword = crossword.Crossword(width=width,
+                                                height=height,
+                                                lang_code=lang,
+                                                difficulty=difficulty,
+                                                backend=self.backend)
+
+        metrics.GENERATION_SECONDS.observe(time.perf_counter() - t_start, source)
+        if not new_crossword.is_generated():
+            # not kept, so the next request tries again
+            logging.error("crossword generation failed: %s", str((lang, difficulty, width, height)))
+            return
+        self._set_crossword(new_crossword)
+
+    def _set_crossword(self, new_crossword: crossword.Crossword):
+        # updates of an earlier crossword can not be replayed on this one
+        self.crossword = new_crossword
+        self._update_log.clear()
+
+    def add_updates(self, updates: list) -> int:
+        # records updates applied to the crossword, returns the new version
+        self.version += 1
+        self._update_log.append((self.version, updates))
+        return self.version
+
+    def add_pending_updates(self, updates: list) -> bool:
+        # collects updates until the next flush, later updates of a cell replace earlier ones.
+        # Returns True if a flush has to be scheduled
+        for update in updates:
+            self._pending_updates[(update['x'], update['y'])] = update
+
+        if self._flush_scheduled:
+            return False
+        self._flush_scheduled = True
+        return True
+
+    def take_pending_updates(self) -> list:
+        updates = list(self._pending_updates.values())
+        self._pending_updates = {}
+        self._flush_scheduled = False
+        return updates
+
+    def end_flush(self):
+        # called when the scheduled flush is over, also if it failed, so the next update schedules a new one
+        self._flush_scheduled = False
+        self.flush_task = None
+
+    def get_updates_since(self, version: int) -> list:
+        # the updates applied after the given version merged per cell, or None if some of
+        # them are not in the log anymore and the whole crossword has to be sent
+        if version == self.version:
+            return []
+
+        if version > self.version or len(self._update_log) == 0 or self._update_log[0][0] > version + 1:
+            return None
+
+        merged = {}
+        for update_version, updates in self._update_log:
+            if update_version <= version:
+                continue
+            for update in updates:
+                # later updates of a cell replace earlier ones
+                merged[(update['x'], update['y'])] = update
+
+        return list(merged.values())
+
+    def has_crossword(self) -> bool:
+        return self.crossword is not None
 
     def get_crossword(self, lang: str = "en", difficulty: int = 0) -> crossword.Crossword:
+        # returns None if no crossword could be generated
         if self.crossword is None:
             self.create_crossword(lang=lang, difficulty=difficulty)
 
         return self.crossword
 
+    async def get_crossword_async(self, lang: str = "en", difficulty: int = 0) -> crossword.Crossword:
+        if self.crossword is None:
+            # several sockets may register while the crossword is still generated
+            if self._crossword_lock is None:
+                self._crossword_lock = asyncio.Lock()
+
+            async with self._crossword_lock:
+                if self.crossword is None:
+                    await self.create_crossword_async(lang=lang, difficulty=difficulty)
+
+        return self.crossword
+
+    def get_crossword_frame(self, wire_format: str = "json", codec=json_websockets.JSON_CODEC):
+        # the encoded 'crossword' message, built once per wire format ("json" or "compact")
+        # and codec and sent as is to every joining socket
+        if self._crossword_frames is None or self._crossword_frames[0] is not self.crossword:
+            self._crossword_frames = (self.crossword, {})
+
+        frames = self._crossword_frames[1]
+        key = (wire_format, codec.name)
+        if key not in frames:
+            if wire_format == "compact":
+                serialized = self.crossword.serialize_compact()
+            else:
+                serialized = self.crossword.serialize()
+            frames[key] = codec.encode({
+                'type': 'crossword',
+                'crossword': serialized
+            })
+
+        return frames[key]
+
     def touch(self):
         self.last_touched = dt.datetime.utcnow()
 
@@ -0,0 +1,192 @@
+import json
+import mmap
+import os
+import struct
+import logging
+import numpy as np
+from string import digits
+
+# binary word database, generated from the en.json/de.json dictionaries.
+#
+# All sections are little endian arrays, the file is opened with mmap so every process
+# shares the same physical pages and nothing is parsed up front. Words are sorted by
+# their utf-8 bytes, a word's id is its position in that order.
+#
+# layout:
+#   header:  magic, version, number of words, offsets of the following sections
+#   words:   u32 offsets[n + 1], utf-8 blob
+#   num_translations:   u32[n]
+#   normalized_lengths: u16[n], 0 for words which can not be used in a grid
+#   for antonyms, synonyms and senses:
+#     u32 list offsets[n + 1] (into the string table), u32 string offsets[m + 1], utf-8 blob
+
+MAGIC = b"CWDB"
+VERSION = 1
+
+ATTRIBUTES = ("antonyms", "synonyms", "senses")
+
+_HEADER = struct.Struct("<4sII" + "Q" * (4 + 3 * len(ATTRIBUTES)))
+
+
+def normalize_word(word: str) -> str:
+    word = word.translate(normalize_word.remove_digits)
+    return word.lower()
+
+
+normalize_word.remove_digits = str.maketrans('', '', digits)
+
+
+def get_normalized_length(word: str) -> int:
+    # length of the word inside the grid, 0 if the word can not be used at all
+    if not word.isalnum():
+        return 0
+    n = len(normalize_word(word))
+    return n if n >= 2 else 0
+
+
+def _pack_strings(strings: list):
+    # returns (u32 offsets, utf-8 blob)
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def build_database(json_file: str, db_file: str):
+    logging.info("building word database %s from %s", db_file, json_file)
+
+    with open(json_file, "r") as f:
+        raw_db = json.load(f)
+
+    words = sorted(raw_db.keys(), key=lambda word: word.encode("utf-8"))
+
+    sections = []
+
+    word_offsets, word_blob = _pack_strings(words)
+    sections += [word_offsets.tobytes(), word_blob]
+
+    sections.append(np.array([raw_db[word]['num_translations'] for word in words], dtype='<u4').tobytes())
+    sections.append(np.array([get_normalized_length(word) for word in words], dtype='<u2').tobytes())
+
+    for attr in ATTRIBUTES:
+        strings = []
+        list_offsets = np.zeros(len(words) + 1, dtype='<u4')
+        for i, word in enumerate(words):
+            values = raw_db[word].get(attr)
+            if values is not None:
+                strings += values
+            list_offsets[i + 1] = len(strings)
+
+        string_offsets, blob = _pack_strings(strings)
+        sections += [list_offsets.tobytes(), string_offsets.tobytes(), blob]
+
+    section_offsets = []
+    position = _HEADER.size
+    for section in sections:
+        # keep numeric arrays aligned
+        position += (-position) % 8
+        section_offsets.append(position)
+        position += len(section)
+
+    # write to a temporary file first, several processes might build at once
+    tmp_file = f"{db_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(words), *section_offsets))
+        for offset, section in zip(section_offsets, sections):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(section)
+
+    os.replace(tmp_file, db_file)
+
+    logging.info("word database built: %s words", str(len(words)))
+
+
+class WordDatabase(object):
+    def __init__(self, db_file: str):
+        with open(db_file, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n, *offsets = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported word database: {db_file}")
+
+        self._n = n
+
+        def u32(offset: int, count: int) -> np.ndarray:
+            return np.frombuffer(self._mmap, dtype='<u4', count=count, offset=offset)
+
+        self._word_offsets = u32(offsets[0], n + 1)
+        self._word_blob = offsets[1]
+        self._num_translations = u32(offsets[2], n)
+        self._normalized_lengths = np.frombuffer(self._mmap, dtype='<u2', count=n, offset=offsets[3])
+
+        self._attributes = {}
+        for i, attr in enumerate(ATTRIBUTES):
+            list_offsets = u32(offsets[4 + 3 * i], n + 1)
+            n_strings = int(list_offsets[-1])
+            string_offsets = u32(offsets[5 + 3 * i], n_strings + 1)
+            self._attributes[attr] = (list_offsets, string_offsets, offsets[6 + 3 * i])
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _get_word_bytes(self, word_id: int) -> bytes:
+        start = self._word_blob + int(self._word_offsets[word_id])
+        end = self._word_blob + int(self._word_offsets[word_id + 1])
+        return self._mmap[start:end]
+
+    def get_word(self, word_id: int) -> str:
+        return self._get_word_bytes(word_id).decode("utf-8")
+
+    def find(self, word: str) -> int:
+        # binary search for the word's id, raises KeyError if it is unknown
+        key = word.encode("utf-8")
+        lo = 0
+        hi = self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._get_word_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._n or self._get_word_bytes(lo) != key:
+            raise KeyError(word)
+        return lo
+
+    def __contains__(self, word: str) -> bool:
+        try:
+            self.find(word)
+            return True
+        except KeyError:
+            return False
+
+    def get_num_translations(self) -> np.ndarray:
+        return self._num_translations
+
+    def get_normalized_lengths(self) -> np.ndarray:
+        return self._normalized_lengths
+
+    def get_attribute_counts(self, attr: str) -> np.ndarray:
+        # number of items of the attribute for every word id
+        list_offsets, _, _ = self._attributes[attr]
+        return np.diff(list_offsets)
+
+    def count_attribute(self, word_id: int, attr: str) -> int:
+        list_offsets, _, _ = self._attributes[attr]
+        return int(list_offsets[word_id + 1] - list_offsets[word_id])
+
+    def get_attribute_item(self, word_id: int, attr: str, i: int) -> str:
+        list_offsets, string_offsets, blob = self._attributes[attr]
+        k = int(list_offsets[word_id]) + i
+        start = blob + int(string_offsets[k])
+        end = blob + int(string_offsets[k + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def get_attribute(self, word_id: int, attr: str) -> list:
+        return [self.get_attribute_item(word_id, attr, i) for i in range(self.count_attribute(word_id, attr))]
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    build_database(sys.argv[1], sys.argv[2])